@@ -36,6 +36,7 @@ import os.path as _os_path
 
 from update_copyright import __version__
 from update_copyright import LOG as _LOG
+from update_copyright import utils as _utils
 from update_copyright.project import Project
 
 
@@ -43,6 +44,8 @@ if __name__ == '__main__':
     import argparse
     import sys
 
+    from update_copyright.planner import STRATEGIES
+
     p = argparse.ArgumentParser(description=__doc__)
     p.add_argument(
         '--version', action='version',
@@ -59,9 +62,92 @@ if __name__ == '__main__':
     p.add_argument(
         '--no-pyfile', dest='pyfile', default=True, action='store_const',
         const=False, help="Don't update the pyfile")
+    p.add_argument(
+        '--history', dest='history', default='auto',
+        choices=STRATEGIES,
+        help=(
+            'How to look up file history: with per-file VCS queries, by '
+            'indexing the whole history once, or (auto, the default) '
+            'whichever is estimated to be cheaper'))
+    p.add_argument(
+        '--scan-history', dest='history', action='store_const',
+        const='scan', help='Same as --history scan')
+    p.add_argument(
+        '--import-history', dest='import_history', metavar='PATH',
+        help=(
+            'If the history is scanned, start from the snapshot at PATH and '
+            'only scan newer commits'))
+    p.add_argument(
+        '--export-history', dest='export_history', metavar='PATH',
+        help=(
+            'Save a snapshot of the scanned history to PATH (implies '
+            '--history scan)'))
     p.add_argument(
         '--dry-run', dest='dry_run', default=False, action='store_const',
         const=True, help="Don't make any changes")
+    p.add_argument(
+        '--progress', dest='progress', default=False, action='store_const',
+        const=True,
+        help='Show a live file count with an ETA (only on a terminal)')
+    p.add_argument(
+        '--events', dest='events', metavar='PATH',
+        help=(
+            "Write a JSON object per line to PATH ('-' for stdout) for each "
+            'file started, skipped, checked, or changed'))
+    p.add_argument(
+        '--journal', dest='journal', metavar='PATH',
+        help=(
+            'Append a line to PATH for each finished file, so an interrupted '
+            'run can be resumed with --resume'))
+    p.add_argument(
+        '--resume', dest='resume', default=False, action='store_const',
+        const=True,
+        help=(
+            'Skip the files --journal lists as finished against the same '
+            'history and configuration, and unchanged since'))
+    p.add_argument(
+        '--stage-jobs', dest='stage_jobs', default=[], action='append',
+        metavar='STAGE=N',
+        help=(
+            'Number of worker threads for one file-update stage (filter, '
+            'read, history, render, or write).  May be repeated'))
+    p.add_argument(
+        '--repository', dest='repositories', default=[], action='append',
+        metavar='PATH',
+        help=(
+            'Update the repository rooted at PATH (or configured by the '
+            'config file at PATH).  Repeat to update several repositories '
+            'with a shared worker pool, ignoring --config and any files'))
+    p.add_argument(
+        '-j', '--jobs', dest='jobs', default=4, type=int, metavar='N',
+        help='Number of worker threads shared by all --repository updates')
+    p.add_argument(
+        '--repository-jobs', dest='repository_jobs', default=1, type=int,
+        metavar='N', help='Maximum number of workers on any one repository')
+    p.add_argument(
+        '--patch', dest='patch', metavar='PATH',
+        help=(
+            "Stream a `git apply`-compatible patch of the changes to PATH "
+            "('-' for stdout) as each file is processed.  Combine with "
+            '--dry-run to leave the tree untouched'))
+    p.add_argument(
+        '--shard', dest='shard', metavar='I/N',
+        help=(
+            'Only update the files in shard I of N (counting from one), '
+            'split by a hash of their paths.  Only shard 1 updates AUTHORS '
+            'and the pyfile'))
+    p.add_argument(
+        '--report', dest='report', metavar='PATH',
+        help=(
+            "Write a JSON report with a patch of the changes to PATH ('-' "
+            'for stdout)'))
+    p.add_argument(
+        '--merge', dest='merge', default=False, action='store_const',
+        const=True,
+        help=(
+            'Treat the positional arguments as --report files from every '
+            'shard of a run.  Print their combined patch to stdout (or '
+            '--patch) and a summary to stderr'))
     p.add_argument(
         '-v', '--verbose', dest='verbose', default=0, action='count',
         help='Increment verbosity')
@@ -72,14 +158,142 @@ if __name__ == '__main__':
             'project)'))
 
     args = p.parse_args()
+    if args.resume and not args.journal:
+        p.error('--resume requires --journal')
+    if [args.events, args.patch, args.report].count('-') > 1:
+        p.error('only one of --events, --patch, and --report may use stdout')
 
     _LOG.setLevel(max(_logging.DEBUG, _logging.ERROR - 10*args.verbose))
 
+    if args.merge:
+        from update_copyright import shard as _shard
+        reports = []
+        for path in args.file:
+            with open(path, 'r') as f:
+                reports.append(_shard.Report.load(f))
+        try:
+            merged = _shard.merge(reports)
+        except ValueError as e:
+            p.error(str(e))
+        if args.patch and args.patch != '-':
+            with open(args.patch, 'w') as f:
+                f.write(merged.patch)
+        else:
+            sys.stdout.write(merged.patch)
+        sys.stderr.write(
+            '{} files considered, {} skipped, {} changed in {:.2f} s\n'.format(
+                merged.total, merged.skipped, len(merged.changed),
+                merged.elapsed))
+        if args.report:
+            with open(args.report, 'w') as f:
+                merged.dump(f)
+        sys.exit(0)
+
+    if args.repositories:
+        from update_copyright import batch
+        reports = batch.run(
+            paths=args.repositories, jobs=args.jobs,
+            repository_jobs=args.repository_jobs, dry_run=args.dry_run,
+            authors=args.authors, files=args.files, pyfile=args.pyfile)
+        for report in reports:
+            print(report)
+            for filename in report.changed:
+                print('  {}'.format(filename))
+        sys.exit(int(any(report.errors for report in reports)))
+
+    workers = {}
+    for stage_jobs in args.stage_jobs:
+        from update_copyright import pipeline as _pipeline
+        stage,_,count = stage_jobs.partition('=')
+        if stage not in _pipeline.STAGES or not count.isdigit() or (
+                int(count) < 1):
+            p.error('invalid --stage-jobs {!r} (expected STAGE=N with '
+                    'STAGE one of {})'.format(
+                    stage_jobs, ', '.join(_pipeline.STAGES)))
+        workers[stage] = int(count)
+    shard = report = patch = None
+    if args.shard or args.report:
+        from update_copyright import shard as _shard
+        if args.shard:
+            try:
+                shard = _shard.parse(args.shard)
+            except ValueError as e:
+                p.error(str(e))
     project = Project(root=_os_path.dirname(_os_path.abspath(args.config)))
     project.load_config(open(args.config, 'r'))
-    if args.authors and project.with_authors:
-        project.update_authors(dry_run=args.dry_run)
+    patches = []
+    if args.report:
+        import io
+        report = _shard.Report(shard=shard, root=project._root)
+        report_patch = io.StringIO()
+        patches.append(report_patch)
+    if args.patch == '-':
+        patches.append(sys.stdout)
+    elif args.patch:
+        patches.append(open(args.patch, 'w'))
+    if len(patches) == 1:
+        patch = patches[0]
+    elif patches:
+        patch = _utils.Tee(patches)
+    first_shard = shard is None or shard[0] == 1
+    if args.export_history:
+        args.history = 'scan'
+    try:
+        if args.history == 'scan':
+            project.index_history(snapshot=args.import_history)
+        if args.export_history:
+            project.save_history(args.export_history)
+    except NotImplementedError as e:
+        p.error('cannot scan the history ({} is not supported)'.format(e))
+    if args.authors and project.with_authors and first_shard:
+        if project.update_authors(dry_run=args.dry_run, patch=patch):
+            if report:
+                report.changed.append('AUTHORS')
     if args.files and project.with_files:
-        project.update_files(files=args.file, dry_run=args.dry_run)
-    if args.pyfile and project._pyfile:
-        project.update_pyfile(dry_run=args.dry_run)
+        from update_copyright import progress as _progress
+        progress = []
+        if report:
+            progress.append(report)
+        if args.progress:
+            progress.append(_progress.Terminal())
+        events = None
+        if args.events == '-':
+            progress.append(_progress.EventStream(sys.stdout))
+        elif args.events:
+            events = open(args.events, 'w')
+            progress.append(_progress.EventStream(events))
+        journal = None
+        if args.journal:
+            from update_copyright.journal import Journal
+            journal = Journal(
+                args.journal,
+                fingerprint=project.history_fingerprint(strategy=args.history),
+                root=project._root, resume=args.resume)
+            if args.resume:
+                _LOG.info('resuming with {} finished files from {}'.format(
+                    journal.resumed, args.journal))
+        try:
+            project.update_files(
+                files=args.file, dry_run=args.dry_run,
+                progress=_progress.Group(progress), shard=shard, patch=patch,
+                workers=workers, history=args.history,
+                snapshot=args.import_history, journal=journal)
+        finally:
+            if journal:
+                journal.close()
+            if events:
+                events.close()
+    if args.pyfile and project._pyfile and first_shard:
+        if project.update_pyfile(dry_run=args.dry_run, patch=patch):
+            if report:
+                report.changed.append(_utils.relative_path(
+                    project._pyfile, project._root))
+    if args.patch and args.patch != '-':
+        patches[-1].close()
+    if report:
+        report.patch = report_patch.getvalue()
+        if args.report == '-':
+            report.dump(sys.stdout)
+        else:
+            with open(args.report, 'w') as f:
+                report.dump(f)
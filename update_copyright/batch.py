@@ -0,0 +1,251 @@
+# Copyright (C) 2014 W. Trevor King <wking@tremily.us>
+#
+# This file is part of update-copyright.
+#
+# update-copyright is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# update-copyright is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# update-copyright.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Update many repositories from a single process.
+
+All repositories share one pool of worker threads.  Each repository
+is first loaded (config, ``AUTHORS``, and pyfile), and then its files
+are fed to the pool, with at most `repository_jobs` of them in flight
+for any single repository so one huge repository cannot starve the
+rest.  As in `Project.update_files`, the files are handed out in
+batches, each prefetched by the VCS backend (e.g. blamed in parallel)
+first, and the backend's caches are flushed once a repository's last
+file is done.
+"""
+
+import concurrent.futures as _futures
+import itertools as _itertools
+import os.path as _os_path
+import time as _time
+import traceback as _traceback
+
+from . import LOG as _LOG
+from . import utils as _utils
+from .project import Project as _Project
+
+
+CONFIG = '.update-copyright.conf'
+
+
+class RepositoryReport (object):
+    """Outcome of updating a single repository."""
+    def __init__(self, path):
+        self.path = path
+        self.config = path
+        if _os_path.isdir(path):
+            self.config = _os_path.join(path, CONFIG)
+        self.root = _os_path.dirname(_os_path.abspath(self.config))
+        self.changed = []
+        self.errors = []
+        self.start = None
+        self.stop = None
+
+    def __str__(self):
+        status = 'ok'
+        if self.errors:
+            status = 'FAILED ({} errors)'.format(len(self.errors))
+        return '{}: {} changed in {:.2f} s, {}'.format(
+            self.path, len(self.changed), self.elapsed, status)
+
+    @property
+    def elapsed(self):
+        if self.start is None:
+            return 0
+        return (self.stop or _time.time()) - self.start
+
+
+class _Repository (object):
+    """Hand out the tasks for one repository, in order."""
+    def __init__(self, path, dry_run=False, authors=True, files=True,
+                 pyfile=True):
+        self.report = RepositoryReport(path=path)
+        self.running = 0
+        self._dry_run = dry_run
+        self._authors = authors
+        self._files = files
+        self._pyfile = pyfile
+        self._project = None
+        self._pending = iter(())
+        self._batch = iter(())
+        self._waiting = False
+        self._flushed = False
+
+    def next_task(self):
+        """Return the next ``(task, done)`` pair, or ``None``.
+
+        ``None`` means that no task is ready.  Otherwise `done` is
+        called with the task's result (``None`` if it failed) by
+        `complete`.
+        """
+        if self._waiting or self._flushed:
+            return None
+        if self._project is None:
+            if self.report.errors:
+                return None
+            self._waiting = True
+            self.report.start = _time.time()
+            return (self._load, self._loaded)
+        for filename in self._batch:
+            return (lambda: self._update_file(filename), self._updated)
+        batch = list(_itertools.islice(
+            self._pending, self._project._batch_size))
+        if batch:
+            self._batch = iter(batch)
+            self._waiting = True
+            return (lambda: self._prefetch(batch), self._prefetched)
+        if self.running:
+            return None
+        self._flushed = True
+        return (self._project._vcs.flush, self._updated)
+
+    def complete(self, future, done):
+        """Record the outcome of `future`, a task from `next_task`."""
+        self.running -= 1
+        try:
+            result = future.result()
+        except Exception as e:
+            _LOG.error('{}: {}'.format(self.report.path, e))
+            self.report.errors.append(_traceback.format_exc())
+            result = None
+        done(result)
+        self.report.stop = _time.time()
+
+    def _loaded(self, result):
+        self._waiting = False
+        if result is not None:
+            self._project,changed,files = result
+            self.report.changed.extend(changed)
+            self._pending = iter(files)
+
+    def _prefetched(self, result):
+        self._waiting = False
+
+    def _updated(self, result):
+        if result is not None:
+            self.report.changed.append(result)
+
+    def _load(self):
+        project = _Project(root=self.report.root)
+        with open(self.report.config, 'r') as f:
+            project.load_config(f)
+        changed = []
+        if self._authors and project.with_authors:
+            if project.update_authors(dry_run=self._dry_run):
+                changed.append(_os_path.join(project._root, 'AUTHORS'))
+        if self._pyfile and project._pyfile:
+            if project.update_pyfile(dry_run=self._dry_run):
+                changed.append(project._pyfile)
+        files = []
+        if self._files and project.with_files:
+            files = list(_utils.list_files(root=project._root))
+            project._get_classifier().prefetch(
+                [_os_path.relpath(f, project._root) for f in files])
+        return (project, changed, files)
+
+    def _prefetch(self, batch):
+        # skip files the config rules out (the VCS checks are left to
+        # `_update_file`)
+        self._project._vcs.prefetch([
+            filename for filename in batch
+            if self._project._ignore_reason(
+                filename=filename, vcs=False) is None])
+
+    def _update_file(self, filename):
+        if self._project._ignored_file(filename=filename):
+            return None
+        if self._project.update_file(
+                filename=filename, dry_run=self._dry_run):
+            return filename
+        return None
+
+
+def run(paths, jobs=4, repository_jobs=1, dry_run=False, authors=True,
+        files=True, pyfile=True):
+    """Update each repository in `paths`.
+
+    Each path is either a repository root containing an
+    ``.update-copyright.conf`` or the path to a config file.  Returns
+    a list of `RepositoryReport` instances, in the same order as
+    `paths`.
+
+    A repository that fails (e.g. because its config is missing) is
+    reported, while the others carry on.  Backend caches, such as the
+    blame cache, are saved as each repository finishes.
+
+    >>> import json, os, tempfile
+    >>> from .benchmark import synthetic_repository
+    >>> tmpdir = tempfile.mkdtemp()
+    >>> def repository(name, files):
+    ...     root = os.path.join(tmpdir, name)
+    ...     names = synthetic_repository(root, commits=20, files=files)
+    ...     with open(os.path.join(root, CONFIG), 'w') as f:
+    ...         _ = f.write(
+    ...             '[project]\\nname: {}\\nvcs: Git\\nblame: yes\\n'
+    ...             '[files]\\nauthors: no\\nfiles: yes\\n'
+    ...             'ignored: .update-copyright.conf | .git*\\n'
+    ...             '[copyright]\\nlong: Part of {{project}}.\\n'.format(name))
+    ...     for name in names:
+    ...         with open(os.path.join(root, name), 'r+') as f:
+    ...             contents = f.read()
+    ...             _ = f.seek(0)
+    ...             _ = f.write('# Copyright (C) 1990 A\\n\\n' + contents)
+    ...     return (root, len(names))
+    >>> a,a_files = repository('a', files=5)
+    >>> b,b_files = repository('b', files=8)
+    >>> missing = os.path.join(tmpdir, 'missing', CONFIG)
+    >>> reports = run([a, missing, b], jobs=2)
+    >>> [report.path for report in reports] == [a, missing, b]
+    True
+    >>> [len(report.changed) for report in reports] == [a_files, 0, b_files]
+    True
+    >>> [len(report.errors) for report in reports]
+    [0, 1, 0]
+    >>> with open(os.path.join(
+    ...         a, '.git', 'update-copyright', 'blame-cache.json')) as f:
+    ...     len(json.load(f)['blobs']) > 0
+    True
+    """
+    repositories = [
+        _Repository(path=path, dry_run=dry_run, authors=authors,
+                    files=files, pyfile=pyfile)
+        for path in paths]
+    futures = {}
+    with _futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        while True:
+            submitted = True
+            while submitted and len(futures) < jobs:
+                submitted = False
+                for repository in repositories:
+                    if len(futures) >= jobs:
+                        break
+                    if repository.running >= repository_jobs:
+                        continue
+                    task = repository.next_task()
+                    if task is None:
+                        continue
+                    task,callback = task
+                    futures[pool.submit(task)] = (repository, callback)
+                    repository.running += 1
+                    submitted = True
+            if not futures:
+                break
+            done,not_done = _futures.wait(
+                futures, return_when=_futures.FIRST_COMPLETED)
+            for future in done:
+                repository,callback = futures.pop(future)
+                repository.complete(future, callback)
+    return [repository.report for repository in repositories]
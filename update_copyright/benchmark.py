@@ -0,0 +1,676 @@
+# Copyright (C) 2014 W. Trevor King <wking@tremily.us>
+#
+# This file is part of update-copyright.
+#
+# update-copyright is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# update-copyright is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# update-copyright.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks for the performance-sensitive parts of update-copyright.
+
+Run with::
+
+  $ python -m update_copyright.benchmark memory --paths 100000
+  $ python -m update_copyright.benchmark shared --paths 100000
+  $ python -m update_copyright.benchmark commit-graph --commits 20000
+  $ python -m update_copyright.benchmark hacks --hacks 10000
+  $ python -m update_copyright.benchmark stress --threads 16
+  $ python -m update_copyright.benchmark shards --shards 4
+  $ python -m update_copyright.benchmark importtime
+"""
+
+import calendar as _calendar
+import fnmatch as _fnmatch
+import concurrent.futures as _futures
+import io as _io
+import multiprocessing as _multiprocessing
+import os as _os
+import pickle as _pickle
+import random as _random
+import shutil as _shutil
+import subprocess as _subprocess
+import sys as _sys
+import tempfile as _tempfile
+import time as _time
+import tracemalloc as _tracemalloc
+
+from .hacks import PathTrie as _PathTrie
+from .history import HistoryStore as _HistoryStore
+from .history import SharedIndex as _SharedIndex
+
+
+def synthetic_history(paths=10000, commits=None, authors=50,
+                      paths_per_commit=5, seed=0):
+    """Generate ``(timestamp, year, author, paths)`` commit tuples."""
+    if commits is None:
+        commits = paths
+    rand = _random.Random(seed)
+    path_names = ['dir{}/sub{}/file{}.c'.format(i % 97, i % 13, i)
+                  for i in range(paths)]
+    author_names = ['Author {0} <author{0}@example.com>'.format(i)
+                    for i in range(authors)]
+    for i in range(commits):
+        timestamp = 946684800 + i * 3600
+        year = 2000 + i * 10 // commits
+        yield (timestamp, year, rand.choice(author_names),
+               rand.sample(path_names, paths_per_commit))
+
+
+def _measure(fn):
+    _tracemalloc.start()
+    try:
+        result = fn()
+        current,peak = _tracemalloc.get_traced_memory()
+    finally:
+        _tracemalloc.stop()
+    return (result, current, peak)
+
+
+def _naive_history(commits):
+    history = {}
+    for timestamp,year,author,paths in commits:
+        for path in paths:
+            years,authors = history.setdefault(path, (set(), set()))
+            years.add(year)
+            authors.add(author)
+    return history
+
+def _compact_history(commits):
+    history = _HistoryStore()
+    for timestamp,year,author,paths in commits:
+        history.add_commit(
+            timestamp=timestamp, year=year, author=author, paths=paths)
+    history.years(commits[0][3][0])  # force the group-by
+    return history
+
+
+def memory(paths=10000, **kwargs):
+    """Compare `HistoryStore` memory use with a dict of sets."""
+    commits = list(synthetic_history(paths=paths, **kwargs))
+
+    def naive():
+        return _naive_history(commits)
+
+    def compact():
+        return _compact_history(commits)
+
+    results = {}
+    for name,fn in [('naive', naive), ('compact', compact)]:
+        history,current,peak = _measure(fn)
+        results[name] = {'current': current, 'peak': peak}
+        del history
+    return results
+
+
+# the index in each `shared` worker process
+_WORKER_INDEX = None
+
+
+def _init_worker(index):
+    global _WORKER_INDEX
+    _WORKER_INDEX = index
+
+def _lookup_authors(paths):
+    index = _WORKER_INDEX
+    if isinstance(index, dict):
+        return sum(len(index[path][1]) for path in paths)
+    return sum(len(index.authors(path)) for path in paths)
+
+
+def shared(paths=10000, workers=4, lookups=10000, **kwargs):
+    """Compare pickling a dict of sets to worker processes with `SharedIndex`.
+
+    Each of `workers` freshly spawned processes receives the index
+    and looks up the authors of `lookups` random paths.  Returns the
+    pickled size of what each worker receives and the wall time.
+    """
+    commits = list(synthetic_history(paths=paths, **kwargs))
+    names = sorted(set(path for commit in commits for path in commit[3]))
+    rand = _random.Random(0)
+    chunks = [[rand.choice(names) for i in range(lookups // workers)]
+              for worker in range(workers)]
+    tmpdir = _tempfile.mkdtemp(prefix='update-copyright-')
+    try:
+        index = _SharedIndex.publish(
+            _compact_history(commits), _os.path.join(tmpdir, 'index'))
+        results = {}
+        context = _multiprocessing.get_context('spawn')
+        for name,value in [('pickled', _naive_history(commits)),
+                           ('mapped', index)]:
+            start = _time.time()
+            with context.Pool(workers, initializer=_init_worker,
+                              initargs=(value,)) as pool:
+                pool.map(_lookup_authors, chunks)
+            results[name] = {
+                'payload': len(_pickle.dumps(value)),
+                'seconds': _time.time() - start,
+                }
+        results['mapped']['file'] = _os.path.getsize(index.path)
+        index.close()
+    finally:
+        _shutil.rmtree(tmpdir)
+    return results
+
+
+def synthetic_repository(path, commits=5000, files=500, authors=20,
+                         files_per_commit=3, seed=0):
+    """Create a Git repository at `path` with a synthetic history.
+
+    Returns the sorted paths of the files created (those touched by at
+    least one commit).
+    """
+    rand = _random.Random(seed)
+    touched = set()
+    names = ['dir{}/file{}.c'.format(i % 23, i) for i in range(files)]
+    _subprocess.check_call(['git', 'init', '--quiet', path])
+    p = _subprocess.Popen(['git', 'fast-import', '--quiet'], cwd=path,
+                          stdin=_subprocess.PIPE)
+    for i in range(commits):
+        author = rand.randrange(authors)
+        timestamp = 946684800 + i * 3600
+        lines = [
+            'commit refs/heads/master',
+            'author Author {0} <author{0}@example.com> {1} +0000'.format(
+                author, timestamp),
+            'committer Author {0} <author{0}@example.com> {1} +0000'.format(
+                author, timestamp),
+            'data <<EOF', 'commit {}'.format(i), 'EOF',
+            ]
+        for name in rand.sample(names, files_per_commit):
+            touched.add(name)
+            lines.extend(['M 644 inline {}'.format(name),
+                          'data <<EOF', 'revision {}'.format(i), 'EOF'])
+        p.stdin.write(('\n'.join(lines) + '\n\n').encode('utf-8'))
+    p.stdin.close()
+    if p.wait():
+        raise ValueError(['git', 'fast-import', p.returncode])
+    _subprocess.check_call(
+        ['git', 'checkout', '--quiet', '-f', 'master'], cwd=path)
+    return sorted(touched)
+
+
+def scripted_repository(path, commits):
+    """Create a Git repository at `path` from a list of `commits`.
+
+    Each commit is a ``(year, author, changes)`` tuple, where `author`
+    is a ``Name <email>`` string, and each change is one of
+    ``('M', path, text)``, ``('D', path)``, ``('R', old_path,
+    new_path)``, or ``('G', path, commit)`` (a submodule pointing at
+    `commit`).  Commits are dated June 1st of their year.  Returns
+    the ID of the last commit.
+    """
+    _subprocess.check_call(['git', 'init', '--quiet', path])
+    p = _subprocess.Popen(['git', 'fast-import', '--quiet'], cwd=path,
+                          stdin=_subprocess.PIPE)
+    for i,(year,author,changes) in enumerate(commits):
+        timestamp = _calendar.timegm((year, 6, 1, 0, 0, 0))
+        lines = [
+            'commit refs/heads/master',
+            'author {} {} +0000'.format(author, timestamp),
+            'committer {} {} +0000'.format(author, timestamp),
+            'data <<EOF', 'commit {}'.format(i), 'EOF',
+            ]
+        for change in changes:
+            if change[0] == 'M':
+                lines.extend(['M 644 inline {}'.format(change[1]),
+                              'data <<EOF', change[2].rstrip('\n'), 'EOF'])
+            elif change[0] == 'G':
+                lines.append('M 160000 {} {}'.format(change[2], change[1]))
+            else:
+                lines.append(' '.join(change))
+        p.stdin.write(('\n'.join(lines) + '\n\n').encode('utf-8'))
+    p.stdin.close()
+    if p.wait():
+        raise ValueError(['git', 'fast-import', p.returncode])
+    _subprocess.check_call(
+        ['git', 'checkout', '--quiet', '-f', 'master'], cwd=path)
+    return _subprocess.check_output(
+        ['git', 'rev-parse', 'HEAD'], cwd=path).decode('ascii').strip()
+
+
+def commit_graph(commits=5000, files=500, queries=50, **kwargs):
+    """Time per-file Git queries without and with a commit-graph.
+
+    For each configuration, `queries` random files get the per-file
+    `years`, `authors`, and `is_versioned` queries of
+    `vcs.git.GitBackend` (which use ``--follow``).
+    """
+    from .vcs.git import GitBackend
+
+    tmpdir = _tempfile.mkdtemp(prefix='update-copyright-')
+    try:
+        names = synthetic_repository(
+            tmpdir, commits=commits, files=files, **kwargs)
+        rand = _random.Random(0)
+        sample = [rand.choice(names) for i in range(queries)]
+        results = {}
+        for name in ['none', 'graph']:
+            if name == 'graph':
+                start = _time.time()
+                _subprocess.check_call(
+                    ['git', 'commit-graph', 'write', '--reachable'],
+                    cwd=tmpdir)
+                results['write'] = _time.time() - start
+            backend = GitBackend(root=tmpdir)
+            for filename in sample:
+                filename = _os.path.join(tmpdir, filename)
+                backend.years(filename)
+                backend.authors(filename)
+                backend.is_versioned(filename)
+            stats = backend.stats()['']
+            results[name] = {
+                'state': backend._commit_graph_state(),
+                'queries': stats['path_queries'],
+                'seconds': stats['path_query_seconds'],
+                }
+    finally:
+        _shutil.rmtree(tmpdir)
+    return results
+
+
+def hacks(hacks=10000, lookups=10000):
+    """Compare `PathTrie` hack lookups with checking every pattern.
+
+    Half of the `hacks` patterns are exact paths and half are globs.
+    Returns the seconds spent on `lookups` lookups each way.
+    """
+    patterns = {}
+    for i in range(hacks):
+        if i % 2:
+            pattern = 'vendor{}/lib/file{}.c'.format(i % 97, i)
+        else:
+            pattern = 'vendor{}/gen{}/*.h'.format(i % 97, i)
+        patterns[pattern] = ['Author {}'.format(i)]
+    rand = _random.Random(0)
+    paths = []
+    for i in range(lookups):
+        j = rand.randrange(hacks)
+        paths.append('vendor{}/gen{}/x.h'.format(j % 97, j) if j % 2 == 0
+                     else 'vendor{}/lib/file{}.c'.format(j % 97, j))
+    results = {}
+    start = _time.time()
+    for path in paths:
+        values = set()
+        for pattern,authors in patterns.items():
+            if _fnmatch.fnmatchcase(path, pattern):
+                values.update(authors)
+    results['scan'] = _time.time() - start
+    trie = _PathTrie(patterns)
+    start = _time.time()
+    for path in paths:
+        trie.match(path)
+    results['trie'] = _time.time() - start
+    return results
+
+
+_STRESS_CONFIG = """[project]
+name: stress
+vcs: Git
+
+[files]
+authors: no
+files: yes
+ignored: .update-copyright.conf | .git*
+
+[copyright]
+long: This file is part of {project}.
+
+  {project} is free software: you can redistribute it and/or modify it
+  under the terms of the GNU General Public License.
+
+[author-hacks]
+dir1/: Hack Author <hack@example.com>
+dir2/*.c: Glob Author <glob@example.com>
+
+[year-hacks]
+dir3/**: 1999
+
+[aliases]
+Author 0 <author0@example.com>: Author 1 <author1@example.com>
+"""
+
+
+def _snapshot_tree(root):
+    """Return a dict mapping each file under `root` to its contents."""
+    tree = {}
+    for dirpath,dirnames,filenames in _os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != '.git']
+        for filename in filenames:
+            path = _os.path.join(dirpath, filename)
+            with open(path, 'rb') as f:
+                tree[_os.path.relpath(path, root)] = f.read()
+    return tree
+
+
+def _stale_repository(path, files, commits):
+    """Create a synthetic repository at `path` with stale blurbs."""
+    names = synthetic_repository(path, commits=commits, files=files)
+    with open(_os.path.join(path, '.update-copyright.conf'), 'w') as f:
+        f.write(_STRESS_CONFIG)
+    for name in names:
+        filename = _os.path.join(path, name)
+        with open(filename, 'r') as f:
+            contents = f.read()
+        with open(filename, 'w') as f:
+            f.write('# Copyright (C) 1990 Nobody <nobody@example.com>\n'
+                    '#\n# Stale text.\n\n' + contents)
+
+
+def _load_project(root):
+    from .project import Project
+
+    project = Project(root=root)
+    with open(_os.path.join(root, '.update-copyright.conf')) as f:
+        project.load_config(f)
+    return project
+
+
+def _update_tree(root, threads=1, history='per-file', seed=0):
+    """Update the blurbs under `root` with `threads` threads.
+
+    Every thread shares one fresh `Project`, so its lazily
+    initialized state is first touched concurrently.
+    """
+    project = _load_project(root)
+    if history == 'scan':
+        project.index_history()
+    files = project._candidate_files()
+    _random.Random(seed).shuffle(files)
+
+    def update(filename):
+        if project._ignore_reason(filename) is None:
+            return project.update_file(filename)
+        return False
+
+    start = _time.time()
+    with _futures.ThreadPoolExecutor(max_workers=threads) as pool:
+        changed = sum(pool.map(update, files))
+    return (changed, _time.time() - start)
+
+
+def stress(files=100, commits=500, threads=8, rounds=3, history='per-file'):
+    """Update a synthetic repository from many threads, checking the result.
+
+    A serial run and `rounds` runs with `threads` threads update
+    copies of the same repository (with stale blurbs, hacks, and
+    aliases), and every file must match the serial run byte for byte.
+    Returns the timings, the number of mismatched files, and whether
+    the GIL was enabled.
+
+    >>> results = stress(files=20, commits=40, threads=4, rounds=2)
+    >>> results['files'] > 0, results['mismatches']
+    (True, 0)
+    >>> stress(files=20, commits=40, threads=4, rounds=1,
+    ...        history='scan')['mismatches']
+    0
+    """
+    tmpdir = _tempfile.mkdtemp(prefix='update-copyright-')
+    try:
+        template = _os.path.join(tmpdir, 'template')
+        _stale_repository(template, files=files, commits=commits)
+        serial = _os.path.join(tmpdir, 'serial')
+        _shutil.copytree(template, serial, symlinks=True)
+        changed,seconds = _update_tree(serial, threads=1, history=history)
+        expected = _snapshot_tree(serial)
+        results = {'files': changed, 'serial': seconds, 'threaded': [],
+                   'mismatches': 0}
+        for i in range(rounds):
+            root = _os.path.join(tmpdir, 'threaded-{}'.format(i))
+            _shutil.copytree(template, root, symlinks=True)
+            changed,seconds = _update_tree(
+                root, threads=threads, history=history, seed=i)
+            results['threaded'].append(seconds)
+            tree = _snapshot_tree(root)
+            results['mismatches'] += sum(
+                1 for path in set(expected) | set(tree)
+                if expected.get(path) != tree.get(path))
+            _shutil.rmtree(root)
+    finally:
+        _shutil.rmtree(tmpdir)
+    is_gil_enabled = getattr(_sys, '_is_gil_enabled', None)
+    results['gil'] = True if is_gil_enabled is None else is_gil_enabled()
+    return results
+
+
+def _update_shard(root, shard):
+    """Update `shard` of the project at `root` and return its report.
+
+    The report is returned as `shard.Report.dump` output, as a
+    separate node would upload it.
+    """
+    from .shard import Report
+
+    project = _load_project(root)
+    report = Report(shard=shard, root=project._root)
+    patch = _io.StringIO()
+    project.update_files(progress=report, shard=shard, patch=patch)
+    report.patch = patch.getvalue()
+    stream = _io.StringIO()
+    report.dump(stream)
+    return stream.getvalue()
+
+
+def _patch_files(patch):
+    """Split `patch` into a dict mapping each file's header to its diff."""
+    files = {}
+    for diff in patch.split('diff --git ')[1:]:
+        files[diff.split('\n', 1)[0]] = diff
+    return files
+
+
+def shards(files=100, commits=500, shards=3):
+    """Update a synthetic repository in `shards` processes, checking it.
+
+    Each shard runs in its own freshly spawned process, standing in for
+    a separate node, and updates its files in one copy of the
+    repository.  Their merged report must list the same changes as an
+    unsharded run on another copy, with the same diff for each file,
+    and every file must match the unsharded run byte for byte.
+    Returns the timings, the numbers of changed and mismatched files,
+    and whether the patches match.
+
+    >>> results = shards(files=20, commits=40, shards=3)
+    >>> results['files'] > 0, results['mismatches'], results['patches']
+    (True, 0, True)
+    """
+    from .shard import Report, merge
+
+    tmpdir = _tempfile.mkdtemp(prefix='update-copyright-')
+    try:
+        serial = _os.path.join(tmpdir, 'serial')
+        _stale_repository(serial, files=files, commits=commits)
+        sharded = _os.path.join(tmpdir, 'sharded')
+        _shutil.copytree(serial, sharded, symlinks=True)
+        start = _time.time()
+        output = _io.StringIO()
+        changed = _load_project(serial).update_files(patch=output)
+        results = {'files': len(changed), 'serial': _time.time() - start}
+        start = _time.time()
+        context = _multiprocessing.get_context('spawn')
+        with context.Pool(shards) as pool:
+            dumps = pool.starmap(
+                _update_shard,
+                [(sharded, (i, shards)) for i in range(1, shards + 1)])
+        merged = merge([Report.load(_io.StringIO(dump)) for dump in dumps])
+        results['sharded'] = _time.time() - start
+        expected = _snapshot_tree(serial)
+        tree = _snapshot_tree(sharded)
+        results['mismatches'] = sum(
+            1 for path in set(expected) | set(tree)
+            if expected.get(path) != tree.get(path))
+        results['patches'] = (
+            len(merged.changed) == len(changed) and
+            _patch_files(merged.patch) == _patch_files(output.getvalue()))
+    finally:
+        _shutil.rmtree(tmpdir)
+    return results
+
+
+# Startup budget (in seconds) for `import update_copyright.project`,
+# which is what the command line script pays before doing any work.
+IMPORT_BUDGET = 0.05
+
+
+def importtime(module='update_copyright.project', runs=5):
+    """Return the best cumulative import time of `module` in seconds.
+
+    Each run uses a fresh interpreter with ``-X importtime``, so
+    nothing is cached in `sys.modules`.  Raises `ValueError` if the
+    import fails, or if `module` is missing from the report (e.g.
+    because it is imported by ``site`` at startup).
+    """
+    best = None
+    for i in range(runs):
+        p = _subprocess.Popen(
+            [_sys.executable, '-X', 'importtime', '-c',
+             'import {}'.format(module)],
+            stdout=_subprocess.PIPE, stderr=_subprocess.PIPE)
+        stdout,stderr = p.communicate()
+        if p.returncode:
+            raise ValueError([module, p.returncode, stderr])
+        cumulative = None
+        for line in stderr.decode('utf-8').splitlines():
+            fields = [f.strip() for f in line.split('|')]
+            if len(fields) == 3 and fields[2] == module:
+                cumulative = int(fields[1]) / 1e6
+        if cumulative is None:
+            raise ValueError('no import time reported for {}'.format(module))
+        if best is None or cumulative < best:
+            best = cumulative
+    return best
+
+
+if __name__ == '__main__':
+    import argparse
+
+    p = argparse.ArgumentParser(description=__doc__)
+    subparsers = p.add_subparsers(dest='benchmark')
+    memory_parser = subparsers.add_parser(
+        'memory', help=memory.__doc__.splitlines()[0])
+    memory_parser.add_argument(
+        '--paths', type=int, default=10000, help='number of synthetic paths')
+    shared_parser = subparsers.add_parser(
+        'shared', help=shared.__doc__.splitlines()[0])
+    shared_parser.add_argument(
+        '--paths', type=int, default=10000, help='number of synthetic paths')
+    shared_parser.add_argument(
+        '--workers', type=int, default=4, help='number of worker processes')
+    commit_graph_parser = subparsers.add_parser(
+        'commit-graph', help=commit_graph.__doc__.splitlines()[0])
+    commit_graph_parser.add_argument(
+        '--commits', type=int, default=5000,
+        help='number of synthetic commits')
+    commit_graph_parser.add_argument(
+        '--files', type=int, default=500, help='number of synthetic files')
+    commit_graph_parser.add_argument(
+        '--queries', type=int, default=50, help='number of files queried')
+    hacks_parser = subparsers.add_parser(
+        'hacks', help=hacks.__doc__.splitlines()[0])
+    hacks_parser.add_argument(
+        '--hacks', type=int, default=10000, help='number of hack patterns')
+    hacks_parser.add_argument(
+        '--lookups', type=int, default=10000, help='number of lookups')
+    stress_parser = subparsers.add_parser(
+        'stress', help=stress.__doc__.splitlines()[0])
+    stress_parser.add_argument(
+        '--files', type=int, default=100, help='number of synthetic files')
+    stress_parser.add_argument(
+        '--commits', type=int, default=500,
+        help='number of synthetic commits')
+    stress_parser.add_argument(
+        '--threads', type=int, default=8, help='number of threads')
+    stress_parser.add_argument(
+        '--rounds', type=int, default=3, help='number of threaded runs')
+    stress_parser.add_argument(
+        '--history', choices=['per-file', 'scan'], default='per-file',
+        help='history lookup strategy')
+    shards_parser = subparsers.add_parser(
+        'shards', help=shards.__doc__.splitlines()[0])
+    shards_parser.add_argument(
+        '--files', type=int, default=100, help='number of synthetic files')
+    shards_parser.add_argument(
+        '--commits', type=int, default=500,
+        help='number of synthetic commits')
+    shards_parser.add_argument(
+        '--shards', type=int, default=3, help='number of shard processes')
+    importtime_parser = subparsers.add_parser(
+        'importtime', help=importtime.__doc__.splitlines()[0])
+    importtime_parser.add_argument(
+        '--module', default='update_copyright.project',
+        help='module to import')
+    importtime_parser.add_argument(
+        '--budget', type=float, default=IMPORT_BUDGET,
+        help='maximum acceptable import time in seconds')
+
+    args = p.parse_args()
+
+    if args.benchmark == 'memory':
+        results = memory(paths=args.paths)
+        for name in ['naive', 'compact']:
+            print('{}: {:.1f} MiB retained, {:.1f} MiB peak'.format(
+                name, results[name]['current'] / 2**20,
+                results[name]['peak'] / 2**20))
+    elif args.benchmark == 'shared':
+        results = shared(paths=args.paths, workers=args.workers)
+        for name in ['pickled', 'mapped']:
+            print('{}: {:.1f} MiB pickled per worker, {:.2f} s'.format(
+                name, results[name]['payload'] / 2**20,
+                results[name]['seconds']))
+        print('mapped index file: {:.1f} MiB, shared by all workers'.format(
+            results['mapped']['file'] / 2**20))
+    elif args.benchmark == 'commit-graph':
+        results = commit_graph(
+            commits=args.commits, files=args.files, queries=args.queries)
+        for name in ['none', 'graph']:
+            result = results[name]
+            print('{} ({}): {} --follow queries in {:.2f} s'.format(
+                name, result['state'], result['queries'], result['seconds']))
+        print('commit-graph written in {:.2f} s; speedup {:.1f}x'.format(
+            results['write'],
+            results['none']['seconds'] / results['graph']['seconds']))
+    elif args.benchmark == 'hacks':
+        results = hacks(hacks=args.hacks, lookups=args.lookups)
+        for name in ['scan', 'trie']:
+            print('{}: {:.1f} us per lookup'.format(
+                name, results[name] / args.lookups * 1e6))
+    elif args.benchmark == 'stress':
+        results = stress(
+            files=args.files, commits=args.commits, threads=args.threads,
+            rounds=args.rounds, history=args.history)
+        print('serial: {} files changed in {:.2f} s'.format(
+            results['files'], results['serial']))
+        for seconds in results['threaded']:
+            print('{} threads: {:.2f} s'.format(args.threads, seconds))
+        print('{} mismatched files (GIL {})'.format(
+            results['mismatches'],
+            'enabled' if results['gil'] else 'disabled'))
+        if results['mismatches']:
+            _sys.exit(1)
+    elif args.benchmark == 'shards':
+        results = shards(
+            files=args.files, commits=args.commits, shards=args.shards)
+        print('unsharded: {} files changed in {:.2f} s'.format(
+            results['files'], results['serial']))
+        print('{} shards: {:.2f} s'.format(args.shards, results['sharded']))
+        print('{} mismatched files, patches {}'.format(
+            results['mismatches'],
+            'match' if results['patches'] else 'differ'))
+        if results['mismatches'] or not results['patches']:
+            _sys.exit(1)
+    elif args.benchmark == 'importtime':
+        seconds = importtime(module=args.module)
+        print('import {}: {:.1f} ms (budget {:.1f} ms)'.format(
+            args.module, seconds * 1e3, args.budget * 1e3))
+        if seconds > args.budget:
+            _sys.exit(1)
+    else:
+        p.print_help()
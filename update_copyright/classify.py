@@ -0,0 +1,199 @@
+# Copyright (C) 2014 W. Trevor King <wking@tremily.us>
+#
+# This file is part of update-copyright.
+#
+# update-copyright is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# update-copyright is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# update-copyright.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cheaply classify files as text, binary, or generated.
+
+Decoding an image or archive as text is slow and usually ends in a
+`UnicodeDecodeError`.  `FileClassifier` decides whether a file is
+worth decoding from its extension, VCS attributes, and at most
+`SNIFF_SIZE` leading bytes.
+"""
+
+import os.path as _os_path
+import threading as _threading
+
+
+TEXT = 'text'
+BINARY = 'binary'
+GENERATED = 'generated'
+
+BINARY_EXTENSIONS = frozenset([
+    # images
+    '.bmp', '.gif', '.ico', '.icns', '.jpeg', '.jpg', '.png', '.psd',
+    '.tif', '.tiff', '.webp', '.xcf',
+    # archives and compressed data
+    '.7z', '.bz2', '.deb', '.egg', '.gz', '.jar', '.lz', '.lzma', '.rar',
+    '.rpm', '.tar', '.tbz2', '.tgz', '.war', '.whl', '.xz', '.z', '.zip',
+    '.zst',
+    # fonts
+    '.eot', '.otf', '.ttc', '.ttf', '.woff', '.woff2',
+    # audio and video
+    '.avi', '.flac', '.m4a', '.mkv', '.mov', '.mp3', '.mp4', '.mpeg',
+    '.mpg', '.ogg', '.wav', '.webm',
+    # documents
+    '.doc', '.docx', '.odp', '.ods', '.odt', '.pdf', '.ppt', '.pptx',
+    '.xls', '.xlsx',
+    # compiled objects
+    '.a', '.class', '.dll', '.dylib', '.exe', '.lib', '.o', '.obj',
+    '.pyc', '.pyd', '.pyo', '.so',
+    # databases
+    '.db', '.sqlite', '.sqlite3',
+    ])
+
+MAGIC = (
+    b'\x89PNG',
+    b'GIF87a',
+    b'GIF89a',
+    b'\xff\xd8\xff',  # JPEG
+    b'%PDF',
+    b'PK\x03\x04',  # zip (and jar, docx, ...)
+    b'\x1f\x8b',  # gzip
+    b'BZh',
+    b'\xfd7zXZ\x00',
+    b'7z\xbc\xaf\x27\x1c',
+    b'\x7fELF',
+    b'\xca\xfe\xba\xbe',  # Java class, Mach-O fat binary
+    b'wOFF',
+    b'wOF2',
+    b'OTTO',
+    b'\x00\x01\x00\x00',  # TrueType
+    b'SQLite format 3\x00',
+    )
+
+SNIFF_SIZE = 512
+
+ATTRIBUTES = ('binary', 'text', 'linguist-generated')
+
+
+def classify_extension(filename):
+    """Classify `filename` from its extension alone.
+
+    Returns ``None`` if the extension is not conclusive.
+
+    >>> classify_extension('a/b.PNG')
+    'binary'
+    >>> classify_extension('a/b.py') is None
+    True
+    """
+    extension = _os_path.splitext(filename)[1].lower()
+    if extension in BINARY_EXTENSIONS:
+        return BINARY
+    return None
+
+def classify_head(head):
+    """Classify a file from its leading bytes.
+
+    >>> classify_head(b'\\x89PNG\\r\\n\\x1a\\n')
+    'binary'
+    >>> classify_head(b'abc\\x00def')
+    'binary'
+    >>> classify_head(b'#!/usr/bin/env python\\n')
+    'text'
+    """
+    if head.startswith(MAGIC) or b'\x00' in head:
+        return BINARY
+    return TEXT
+
+def classify_attributes(attributes):
+    """Classify a file from its VCS attributes.
+
+    Returns ``None`` if the attributes are not conclusive.
+
+    >>> classify_attributes({'binary': 'set'})
+    'binary'
+    >>> classify_attributes({'text': 'unset'})
+    'binary'
+    >>> classify_attributes({'linguist-generated': 'true'})
+    'generated'
+    >>> classify_attributes({'linguist-generated': 'false'}) is None
+    True
+    """
+    if attributes.get('binary') == 'set' or attributes.get('text') == 'unset':
+        return BINARY
+    if attributes.get('linguist-generated') in ['set', 'true']:
+        return GENERATED
+    return None
+
+
+class FileClassifier (object):
+    """Classify files under `root`, caching the verdict for each path.
+
+    Paths passed to `classify` and `prefetch` are relative to `root`.
+    Both may be called from several threads.
+    """
+    def __init__(self, root='.', vcs=None):
+        self._root = root
+        self._vcs = vcs
+        self._attributes = {}
+        self._cache = {}
+        self._lock = _threading.Lock()
+
+    def prefetch(self, filenames):
+        """Load VCS attributes for many files with a single query."""
+        if self._vcs is None:
+            return
+        with self._lock:
+            filenames = [f for f in filenames
+                         if f not in self._cache and f not in self._attributes]
+        attributes = self._query_attributes(filenames)
+        with self._lock:
+            for filename in filenames:
+                if filename not in self._cache:
+                    self._attributes[filename] = attributes[filename]
+
+    def _query_attributes(self, filenames):
+        """Return a dict of VCS attributes for each of `filenames`."""
+        # the backend resolves relative paths against the working
+        # directory, not `root`
+        paths = [_os_path.join(self._root, f) for f in filenames]
+        attributes = self._vcs.attributes(paths, names=ATTRIBUTES)
+        return dict((filename, attributes.get(path, {}))
+                    for filename,path in zip(filenames, paths))
+
+    def classify(self, filename):
+        with self._lock:
+            kind = self._cache.get(filename)
+        if kind is not None:
+            return kind
+        kind = self._classify(filename)
+        with self._lock:
+            self._cache[filename] = kind
+            self._attributes.pop(filename, None)
+        return kind
+
+    def _classify(self, filename):
+        kind = classify_extension(filename)
+        if kind is not None:
+            return kind
+        if self._vcs is not None:
+            with self._lock:
+                attributes = self._attributes.get(filename)
+            if attributes is None:
+                # not prefetched (or classified by another thread since)
+                attributes = self._query_attributes([filename])[filename]
+            kind = classify_attributes(attributes)
+            if kind is not None:
+                return kind
+        try:
+            with open(_os_path.join(self._root, filename), 'rb') as f:
+                head = f.read(SNIFF_SIZE)
+        except (IOError, OSError):
+            return TEXT  # let the caller deal with the missing file
+        return classify_head(head)
+
+    def is_text(self, filename):
+        return self.classify(filename) == TEXT
@@ -0,0 +1,87 @@
+# Copyright (C) 2014 W. Trevor King <wking@tremily.us>
+#
+# This file is part of update-copyright.
+#
+# update-copyright is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# update-copyright is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# update-copyright.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Proposed changes to a file's copyright blurbs.
+
+`Project.plan_files` yields `Edit` instances instead of writing to
+disk, so callers can inspect, filter, or serialize them before
+handing them to `Project.apply_edit`.
+"""
+
+
+class Edit (object):
+    """Replace the header region of `path`.
+
+    `span` is the ``(start, end)`` character offset of the region
+    (from the start of the first blurb to the end of the last) in the
+    decoded file, `original` is the text currently in that span, and
+    `header` is its replacement.  `reason` is a short, human-readable
+    explanation of why the change is needed.
+
+    >>> e = Edit(path='a.py', span=(4, 9), original='# old',
+    ...          header='# new', reason='outdated')
+    >>> e
+    <Edit a.py [4:9] outdated>
+    >>> e.apply_to('x=1\\n# old\\ny=2\\n')
+    'x=1\\n# new\\ny=2\\n'
+    >>> e.apply_to('x=1\\n# bad\\ny=2\\n')
+    Traceback (most recent call last):
+      ...
+    ValueError: a.py changed since the edit was planned
+    >>> Edit.from_dict(e.as_dict()) == e
+    True
+    """
+    def __init__(self, path, span, original, header, reason):
+        self.path = path
+        self.span = tuple(span)
+        self.original = original
+        self.header = header
+        self.reason = reason
+
+    def __repr__(self):
+        return '<{} {} [{}:{}] {}>'.format(
+            type(self).__name__, self.path, self.span[0], self.span[1],
+            self.reason)
+
+    def __eq__(self, other):
+        return (isinstance(other, Edit) and
+                self.as_dict() == other.as_dict())
+
+    def __ne__(self, other):
+        return not self == other
+
+    def as_dict(self):
+        """Return a JSON-serializable representation."""
+        return {
+            'path': self.path,
+            'span': list(self.span),
+            'original': self.original,
+            'header': self.header,
+            'reason': self.reason,
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def apply_to(self, contents):
+        """Return `contents` with the edit applied."""
+        start,end = self.span
+        if contents[start:end] != self.original:
+            raise ValueError(
+                '{} changed since the edit was planned'.format(self.path))
+        return contents[:start] + self.header + contents[end:]
@@ -0,0 +1,146 @@
+# Copyright (C) 2014 W. Trevor King <wking@tremily.us>
+#
+# This file is part of update-copyright.
+#
+# update-copyright is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# update-copyright is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# update-copyright.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Match ``[author-hacks]`` and ``[year-hacks]`` paths.
+
+Hack paths are ``/``-separated and relative to the project root.  Any
+path component may be a glob (as for `fnmatch`, but case-sensitive
+and never matching ``/``), and a trailing ``/`` (or a final ``**``
+component) applies the hack to everything under a directory.  The
+patterns are compiled into a trie of path components, so a lookup
+takes time proportional to the depth of the path, however many hacks
+there are.
+"""
+
+import fnmatch as _fnmatch
+import re as _re
+
+
+_GLOB_CHARACTERS = '*?['
+
+
+class _Node (object):
+    __slots__ = ('children', 'globs', 'values', 'subtree')
+
+    def __init__(self):
+        self.children = {}  # exact component -> _Node
+        self.globs = []     # (match function, pattern, _Node)
+        self.values = set()   # for paths ending at this node
+        self.subtree = set()  # for every path beneath this node
+
+
+class PathTrie (object):
+    """Map path patterns to sets of values.
+
+    `hacks` maps each pattern (a string, or a tuple of components) to
+    an iterable of values.
+
+    >>> trie = PathTrie({
+    ...     'a/b.py': ['exact'],
+    ...     'vendor/': ['vendored'],
+    ...     'lib/*.c': ['c source'],
+    ...     '*/README': ['readme'],
+    ...     ('x', 'y'): ['tuple'],
+    ...     })
+    >>> trie.match('a/b.py')
+    {'exact'}
+    >>> trie.match('vendor/zlib/inflate.c')
+    {'vendored'}
+    >>> sorted(trie.match('lib/README')), trie.match(('lib', 'x', 'z.c'))
+    (['readme'], set())
+    >>> trie.match('x/y'), trie.match('vendor')
+    ({'tuple'}, set())
+    >>> sorted(trie.all())
+    ['c source', 'exact', 'readme', 'tuple', 'vendored']
+    >>> len(trie)
+    5
+    """
+    def __init__(self, hacks=None):
+        self._root = _Node()
+        self._all = set()
+        self._count = 0
+        for pattern,values in (hacks or {}).items():
+            self.add(pattern, values)
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def add(self, pattern, values):
+        """Add `values` for paths matching `pattern`."""
+        if isinstance(pattern, tuple):
+            parts = list(pattern)
+        else:
+            parts = pattern.split('/')
+        subtree = parts[-1] in ('', '**')
+        if subtree:
+            parts.pop()
+        if not parts or '**' in parts or '' in parts:
+            raise ValueError('invalid hack path {!r}'.format(pattern))
+        node = self._root
+        for part in parts:
+            if any(c in part for c in _GLOB_CHARACTERS):
+                for match,_part,child in node.globs:
+                    if _part == part:
+                        break
+                else:
+                    child = _Node()
+                    match = _re.compile(_fnmatch.translate(part)).match
+                    node.globs.append((match, part, child))
+            else:
+                child = node.children.get(part)
+                if child is None:
+                    child = node.children[part] = _Node()
+            node = child
+        if subtree:
+            node.subtree.update(values)
+        else:
+            node.values.update(values)
+        self._all.update(values)
+        self._count += 1
+
+    def match(self, path):
+        """Return the union of the values of every pattern matching `path`.
+
+        `path` is a ``/``-separated string or a tuple of components.
+        """
+        if not isinstance(path, tuple):
+            path = path.split('/')
+        values = set()
+        nodes = [self._root]
+        for part in path:
+            children = []
+            for node in nodes:
+                values.update(node.subtree)
+                child = node.children.get(part)
+                if child is not None:
+                    children.append(child)
+                for match,_part,child in node.globs:
+                    if match(part):
+                        children.append(child)
+            nodes = children
+            if not nodes:
+                return values
+        for node in nodes:
+            values.update(node.values)
+        return values
+
+    def all(self):
+        """Return the union of all values."""
+        return set(self._all)
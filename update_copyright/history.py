@@ -0,0 +1,666 @@
+# Copyright (C) 2014 W. Trevor King <wking@tremily.us>
+#
+# This file is part of update-copyright.
+#
+# update-copyright is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# update-copyright is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# update-copyright.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compact, column-oriented storage for repository history.
+
+A dict mapping each path to Python sets of author strings and year
+integers costs hundreds of bytes per entry, which adds up to
+gigabytes for repositories with millions of files.  `HistoryStore`
+instead interns paths and authors into tables and keeps one row per
+(commit, path) pair in typed `array` columns.  Per-path year ranges
+and author sets are computed from those columns with a single
+group-by pass, vectorized with NumPy when it is installed.
+
+Stores can be saved to and loaded from compact snapshot files (see
+`HistoryStore.dump`), so CI runners can share one history index and
+extend it incrementally instead of rescanning (or, in shallow clones,
+being unable to scan) the full history.
+
+A `SharedIndex` publishes the per-path results into a read-only,
+memory-mapped file, so worker processes can look paths up without
+each holding (or unpickling) a copy of the index.
+"""
+
+import array as _array
+import hashlib as _hashlib
+import json as _json
+import os as _os
+import struct as _struct
+import sys as _sys
+import threading as _threading
+import zlib as _zlib
+
+from .lazy import lazy_import as _lazy_import
+
+_mmap = _lazy_import('mmap')
+
+try:
+    _numpy = _lazy_import('numpy')
+except ImportError as _numpy_import_error:
+    _numpy = None
+
+
+# `HistoryStore` groups are computed once, on first lookup, which may
+# come from several threads at once
+_GROUP_LOCK = _threading.Lock()
+
+# PNG-style, so text-mode mangling and truncation are detected
+SNAPSHOT_MAGIC = b'\x89UCH\r\n\x1a\n'
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = _struct.Struct('<8sH32s')  # magic, version, sha256
+
+
+def _to_bytes(column):
+    """Serialize an `array` column as little-endian bytes."""
+    if _sys.byteorder == 'big':
+        column = _array.array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+def _from_bytes(typecode, data):
+    column = _array.array(typecode)
+    column.frombytes(data)
+    if _sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+def _dump_snapshot(stream, commits, paths, authors, min_years, max_years,
+                   offsets, author_ids):
+    """Write the per-path results to `stream` (see `HistoryStore.dump`)."""
+    meta = {
+        'commits': commits,
+        'paths': list(paths),
+        'authors': list(authors),
+        'author_ids': len(author_ids),
+        }
+    payload = _zlib.compress(b''.join([
+        _json.dumps(meta, sort_keys=True).encode('utf-8'), b'\n',
+        _to_bytes(min_years), _to_bytes(max_years),
+        _to_bytes(offsets), _to_bytes(author_ids),
+        ]), 9)
+    stream.write(_SNAPSHOT_HEADER.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_VERSION, _hashlib.sha256(payload).digest()))
+    stream.write(payload)
+
+
+class InternTable (object):
+    """Map strings to dense integer IDs and back.
+
+    >>> t = InternTable()
+    >>> t.intern('a'), t.intern('b'), t.intern('a')
+    (0, 1, 0)
+    >>> len(t)
+    2
+    >>> t[1]
+    'b'
+    >>> 'b' in t, 'c' in t
+    (True, False)
+    >>> t.get('c') is None
+    True
+    """
+    def __init__(self, values=()):
+        self._values = []
+        self._ids = {}
+        for value in values:
+            self.intern(value)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, id):
+        return self._values[id]
+
+    def __contains__(self, value):
+        return value in self._ids
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def get(self, value):
+        return self._ids.get(value)
+
+    def intern(self, value):
+        try:
+            return self._ids[value]
+        except KeyError:
+            id = len(self._values)
+            self._values.append(value)
+            self._ids[value] = id
+            return id
+
+
+class HistoryStore (object):
+    """Columnar record of which authors touched which paths when.
+
+    Paths are ``/``-separated and relative to the repository root.
+
+    >>> h = HistoryStore()
+    >>> h.add_commit(timestamp=1136214245, year=2006, author='A <a@a.com>',
+    ...              paths=['README', 'src/a.c'])
+    >>> h.add_commit(timestamp=1262304000, year=2010, author='B <b@b.edu>',
+    ...              paths=['src/a.c'])
+    >>> len(h)
+    3
+    >>> 'src/a.c' in h, 'src/b.c' in h
+    (True, False)
+    >>> sorted(h.years('src/a.c'))
+    [2006, 2010]
+    >>> sorted(h.years('README'))
+    [2006]
+    >>> sorted(h.authors('src/a.c'))
+    ['A <a@a.com>', 'B <b@b.edu>']
+    >>> sorted(h.years())
+    [2006, 2010]
+    >>> sorted(h.authors())
+    ['A <a@a.com>', 'B <b@b.edu>']
+    >>> h.years('src/b.c')
+    set()
+
+    `commits` maps the ``/``-terminated path of each repository
+    (``''`` for the root repository) to the commit the store is
+    complete up to.
+
+    Scans add rows for renamed files under their new paths (see
+    `GitBackend._scan_history`).  `renames` maps each old path to
+    the paths that take over its history from before the rename, so
+    `update` can do the same to a store of older commits.  It is not
+    saved in snapshots.
+    """
+    def __init__(self):
+        self.commits = {}
+        self.renames = {}
+        self.path_table = InternTable()
+        self.author_table = InternTable()
+        self._timestamps = _array.array('q')
+        self._years = _array.array('H')
+        self._author_ids = _array.array('I')
+        self._path_ids = _array.array('I')
+        self._groups = None
+
+    def __len__(self):
+        return len(self._path_ids)
+
+    def __contains__(self, path):
+        return path in self.path_table
+
+    def add_commit(self, timestamp, year, author, paths):
+        """Record a commit by `author` touching each path in `paths`."""
+        author_id = self.author_table.intern(author)
+        for path in paths:
+            self._timestamps.append(timestamp)
+            self._years.append(year)
+            self._author_ids.append(author_id)
+            self._path_ids.append(self.path_table.intern(path))
+        self._groups = None
+
+    def update(self, other, prefix='', renames=None):
+        """Append the rows of another store, prefixing its paths.
+
+        >>> a = HistoryStore()
+        >>> a.add_commit(timestamp=0, year=2001, author='A', paths=['x'])
+        >>> b = HistoryStore()
+        >>> b.add_commit(timestamp=0, year=2005, author='B', paths=['x'])
+        >>> a.update(b, prefix='sub/')
+        >>> sorted(a.years('sub/x')), sorted(a.authors('sub/x'))
+        ([2005], ['B'])
+        >>> sorted(a.years('x')), sorted(a.authors())
+        ([2001], ['A', 'B'])
+
+        If `other` holds older commits than this store, pass this
+        store's `renames`, so the rows of each renamed path go to the
+        paths that took over its history instead.
+
+        >>> c = HistoryStore()
+        >>> c.renames = {'x': ('y',)}
+        >>> c.update(a, renames=c.renames)
+        >>> sorted(c.years('y')), 'x' in c
+        ([2001], False)
+        """
+        author_map = [self.author_table.intern(a) for a in other.author_table]
+        if renames:
+            path_map = [
+                [self.path_table.intern(prefix + p)
+                 for p in renames.get(path, (path,))]
+                for path in other.path_table]
+            for row,path_id in enumerate(other._path_ids):
+                for id in path_map[path_id]:
+                    self._timestamps.append(other._timestamps[row])
+                    self._years.append(other._years[row])
+                    self._author_ids.append(
+                        author_map[other._author_ids[row]])
+                    self._path_ids.append(id)
+        else:
+            path_map = [self.path_table.intern(prefix + p)
+                        for p in other.path_table]
+            self._timestamps.extend(other._timestamps)
+            self._years.extend(other._years)
+            self._author_ids.extend(author_map[i] for i in other._author_ids)
+            self._path_ids.extend(path_map[i] for i in other._path_ids)
+        for path,commit in other.commits.items():
+            self.commits[prefix + path] = commit
+        for path,followers in other.renames.items():
+            self.renames[prefix + path] = tuple(
+                prefix + follower for follower in followers)
+        self._groups = None
+
+    def _group(self):
+        """Compute per-path year ranges and author IDs.
+
+        Returns ``(min_years, max_years, offsets, author_ids)``, where
+        the authors of path ``i`` are
+        ``author_ids[offsets[i]:offsets[i+1]]``.
+        """
+        if self._groups is None:
+            with _GROUP_LOCK:
+                if self._groups is None:
+                    if _numpy is None:
+                        self._groups = self._group_python()
+                    else:
+                        self._groups = self._group_numpy()
+        return self._groups
+
+    def _group_python(self):
+        # Counting sort of the author column by path ID, so the only
+        # per-path Python objects are transient.
+        count = len(self.path_table)
+        min_years = _array.array('H', [0xffff]) * count
+        max_years = _array.array('H', [0]) * count
+        starts = _array.array('I', [0]) * (count + 1)
+        for path_id,year in zip(self._path_ids, self._years):
+            starts[path_id+1] += 1
+            if year < min_years[path_id]:
+                min_years[path_id] = year
+            if year > max_years[path_id]:
+                max_years[path_id] = year
+        for i in range(count):
+            starts[i+1] += starts[i]
+        fill = _array.array('I', starts)
+        by_path = _array.array('I', [0]) * len(self._path_ids)
+        for path_id,author_id in zip(self._path_ids, self._author_ids):
+            by_path[fill[path_id]] = author_id
+            fill[path_id] += 1
+        del fill
+        offsets = _array.array('I', [0])
+        author_ids = _array.array('I')
+        for i in range(count):
+            author_ids.extend(sorted(set(by_path[starts[i]:starts[i+1]])))
+            offsets.append(len(author_ids))
+        return (min_years, max_years, offsets, author_ids)
+
+    def _group_numpy(self):
+        count = len(self.path_table)
+        path_ids = _numpy.frombuffer(self._path_ids, dtype=_numpy.uint32)
+        years = _numpy.frombuffer(self._years, dtype=_numpy.uint16)
+        author_ids = _numpy.frombuffer(self._author_ids, dtype=_numpy.uint32)
+        min_years = _numpy.full(count, 0xffff, dtype=_numpy.uint16)
+        max_years = _numpy.zeros(count, dtype=_numpy.uint16)
+        _numpy.minimum.at(min_years, path_ids, years)
+        _numpy.maximum.at(max_years, path_ids, years)
+        stride = max(len(self.author_table), 1)
+        keys = _numpy.unique(
+            path_ids.astype(_numpy.uint64) * stride + author_ids)
+        offsets = _numpy.searchsorted(
+            keys // stride, _numpy.arange(count + 1, dtype=_numpy.uint64))
+        return (
+            _array.array('H', min_years.tobytes()),
+            _array.array('H', max_years.tobytes()),
+            _array.array('I', offsets.astype(_numpy.uint32).tobytes()),
+            _array.array(
+                'I', (keys % stride).astype(_numpy.uint32).tobytes()),
+            )
+
+    def years(self, path=None):
+        """Return the first and last years in which `path` changed.
+
+        With `path` ``None``, return the range for the whole
+        repository.  Only the endpoints are returned, since those
+        are all a copyright blurb needs.
+        """
+        if path is None:
+            if not self._years:
+                return set()
+            return set([min(self._years), max(self._years)])
+        path_id = self.path_table.get(path)
+        if path_id is None:
+            return set()
+        min_years,max_years,offsets,author_ids = self._group()
+        return set([min_years[path_id], max_years[path_id]])
+
+    def author_ids(self, path):
+        path_id = self.path_table.get(path)
+        if path_id is None:
+            return []
+        min_years,max_years,offsets,author_ids = self._group()
+        return author_ids[offsets[path_id]:offsets[path_id+1]]
+
+    def authors(self, path=None):
+        """Return the set of authors who changed `path`.
+
+        With `path` ``None``, return every author in the repository.
+        """
+        if path is None:
+            return set(self.author_table)
+        return set(self.author_table[id] for id in self.author_ids(path))
+
+    def nbytes(self):
+        """Approximate size of the columns and group-by results in bytes.
+
+        The intern tables are not included, since the naive layout
+        needs the same strings.
+        """
+        columns = [
+            self._timestamps, self._years, self._author_ids, self._path_ids]
+        if self._groups is not None:
+            columns.extend(self._groups)
+        return sum(c.itemsize * len(c) for c in columns)
+
+    def dump(self, stream):
+        """Write a snapshot of the per-path years and authors to `stream`.
+
+        `stream` is a binary file.  Only the year ranges and author
+        sets are kept, not every commit, so the snapshot is much
+        smaller than the store.  The zlib-compressed payload is
+        preceded by a magic number, a format version, and the SHA-256
+        of the payload.
+
+        >>> import io
+        >>> h = HistoryStore()
+        >>> h.commits[''] = 'abc123'
+        >>> h.add_commit(timestamp=0, year=2006, author='A', paths=['x', 'y'])
+        >>> h.add_commit(timestamp=0, year=2010, author='B', paths=['x'])
+        >>> stream = io.BytesIO()
+        >>> h.dump(stream)
+        >>> loaded = HistoryStore.load(io.BytesIO(stream.getvalue()))
+        >>> loaded.commits
+        {'': 'abc123'}
+        >>> sorted(loaded.years('x')), sorted(loaded.authors('x'))
+        ([2006, 2010], ['A', 'B'])
+        >>> sorted(loaded.years('y')), sorted(loaded.authors('y'))
+        ([2006], ['A'])
+        >>> data = bytearray(stream.getvalue())
+        >>> data[-1] ^= 0xff
+        >>> HistoryStore.load(io.BytesIO(bytes(data)))
+        Traceback (most recent call last):
+          ...
+        ValueError: corrupt history snapshot (checksum mismatch)
+        """
+        min_years,max_years,offsets,author_ids = self._group()
+        _dump_snapshot(
+            stream, commits=self.commits, paths=self.path_table,
+            authors=self.author_table, min_years=min_years,
+            max_years=max_years, offsets=offsets, author_ids=author_ids)
+
+    @classmethod
+    def load(cls, stream):
+        """Load a snapshot written by `dump`.
+
+        Raises `ValueError` if the snapshot is corrupt or from an
+        unsupported format version.  Each path gets one row per
+        author in its first year and one in its last year, with zero
+        timestamps, which is all `years` and `authors` need.
+        """
+        header = stream.read(_SNAPSHOT_HEADER.size)
+        if len(header) < _SNAPSHOT_HEADER.size:
+            raise ValueError('corrupt history snapshot (truncated)')
+        magic,version,digest = _SNAPSHOT_HEADER.unpack(header)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError('not a history snapshot')
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(
+                'unsupported history snapshot version {}'.format(version))
+        payload = stream.read()
+        if _hashlib.sha256(payload).digest() != digest:
+            raise ValueError('corrupt history snapshot (checksum mismatch)')
+        data = _zlib.decompress(payload)
+        meta,_,data = data.partition(b'\n')
+        meta = _json.loads(meta.decode('utf-8'))
+        count = len(meta['paths'])
+        columns = []
+        for typecode,length in [('H', count), ('H', count),
+                                ('I', count + 1), ('I', meta['author_ids'])]:
+            size = _array.array(typecode).itemsize * length
+            columns.append(_from_bytes(typecode, data[:size]))
+            data = data[size:]
+        min_years,max_years,offsets,author_ids = columns
+        history = cls()
+        history.commits = meta['commits']
+        history.path_table = InternTable(meta['paths'])
+        history.author_table = InternTable(meta['authors'])
+        for path_id in range(count):
+            ids = author_ids[offsets[path_id]:offsets[path_id+1]]
+            rows = [(min_years[path_id], id) for id in ids]
+            if max_years[path_id] != min_years[path_id]:
+                rows.append((max_years[path_id], ids[0]))
+            for year,author_id in rows:
+                history._timestamps.append(0)
+                history._years.append(year)
+                history._author_ids.append(author_id)
+                history._path_ids.append(path_id)
+        history._groups = tuple(columns)
+        return history
+
+
+# native byte order, since an index is only shared within one machine
+INDEX_MAGIC = b'\x89UCI\r\n\x1a\n'
+INDEX_VERSION = 2
+# magic, version, first year, last year, paths, authors, author IDs
+_INDEX_HEADER = _struct.Struct('=8sHHHxxIII')
+# (offset, length) in bytes of each section, in `SharedIndex._SECTIONS` order
+_INDEX_SECTIONS = _struct.Struct('=' + 'QQ' * 9)
+
+
+class SharedIndex (object):
+    """Read-only, memory-mapped view of a `HistoryStore`'s results.
+
+    The index file at `path` holds the year range and author IDs of
+    each path in flat, offset-based sections.  Paths are sorted by
+    their UTF-8 encoding and found by binary search, so opening an
+    index is nearly free and the operating system shares its pages
+    between every process that maps it.  Pickling a `SharedIndex`
+    only pickles its path.  Like a `HistoryStore`, it has `commits`
+    and can `dump` a snapshot.
+
+    >>> import os, pickle, tempfile
+    >>> h = HistoryStore()
+    >>> h.commits[''] = 'abc123'
+    >>> h.add_commit(timestamp=0, year=2006, author='A', paths=['x', 'y'])
+    >>> h.add_commit(timestamp=0, year=2010, author='B', paths=['x'])
+    >>> path = os.path.join(tempfile.mkdtemp(), 'index')
+    >>> index = SharedIndex.publish(h, path)
+    >>> sorted(index.years('x')), sorted(index.authors('x'))
+    ([2006, 2010], ['A', 'B'])
+    >>> list(index.author_ids('y')), index.author(0)
+    ([0], 'A')
+    >>> sorted(index.years()), sorted(index.authors())
+    ([2006, 2010], ['A', 'B'])
+    >>> 'y' in index, 'z' in index, len(index)
+    (True, False, 2)
+    >>> index.commits
+    {'': 'abc123'}
+    >>> import io
+    >>> stream = io.BytesIO()
+    >>> index.dump(stream)
+    >>> loaded = HistoryStore.load(io.BytesIO(stream.getvalue()))
+    >>> loaded.commits, sorted(loaded.authors('x'))
+    ({'': 'abc123'}, ['A', 'B'])
+    >>> copy = pickle.loads(pickle.dumps(index))
+    >>> sorted(copy.years('y'))
+    [2006]
+    >>> copy.close()
+    >>> index.close()
+    """
+    _SECTIONS = (
+        ('path_offsets', 'I'),
+        ('path_names', 'B'),
+        ('min_years', 'H'),
+        ('max_years', 'H'),
+        ('author_offsets', 'I'),
+        ('author_ids', 'I'),
+        ('author_name_offsets', 'I'),
+        ('author_names', 'B'),
+        ('commits', 'B'),  # JSON
+        )
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+        self._views = [memoryview(self._mmap)]
+        (magic, version, self._first_year, self._last_year, self._count,
+         self._author_count, ids) = _INDEX_HEADER.unpack_from(self._views[0])
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            self.close()
+            raise ValueError('{} is not a version {} history index'.format(
+                path, INDEX_VERSION))
+        table = _INDEX_SECTIONS.unpack_from(
+            self._views[0], _INDEX_HEADER.size)
+        for i,(name,typecode) in enumerate(self._SECTIONS):
+            offset,length = table[2*i:2*i+2]
+            view = self._views[0][offset:offset + length]
+            self._views.append(view)
+            if typecode != 'B':
+                view = view.cast(typecode)
+                self._views.append(view)
+            setattr(self, '_' + name, view)
+        self.commits = _json.loads(self._commits.tobytes().decode('utf-8'))
+
+    def __reduce__(self):
+        return (type(self), (self.path,))
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, path):
+        return self._find(path) is not None
+
+    def close(self):
+        """Release the mapping.  Views from `author_ids` must be released."""
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+    @classmethod
+    def publish(cls, history, path):
+        """Write the results of `history` to `path` and open them."""
+        min_years,max_years,offsets,author_ids = history._group()
+        names = [p.encode('utf-8') for p in history.path_table]
+        columns = dict((name, _array.array(typecode))
+                       for name,typecode in cls._SECTIONS)
+        columns['path_offsets'].append(0)
+        columns['author_offsets'].append(0)
+        columns['author_name_offsets'].append(0)
+        for i in sorted(range(len(names)), key=names.__getitem__):
+            columns['path_names'].frombytes(names[i])
+            columns['path_offsets'].append(len(columns['path_names']))
+            columns['min_years'].append(min_years[i])
+            columns['max_years'].append(max_years[i])
+            columns['author_ids'].extend(author_ids[offsets[i]:offsets[i+1]])
+            columns['author_offsets'].append(len(columns['author_ids']))
+        for author in history.author_table:
+            columns['author_names'].frombytes(author.encode('utf-8'))
+            columns['author_name_offsets'].append(
+                len(columns['author_names']))
+        columns['commits'].frombytes(
+            _json.dumps(history.commits, sort_keys=True).encode('utf-8'))
+        years = sorted(history.years()) or [0]
+        table = []
+        sections = []
+        offset = _INDEX_HEADER.size + _INDEX_SECTIONS.size
+        for name,typecode in cls._SECTIONS:
+            data = columns[name].tobytes()
+            padding = -offset % 8  # keep every section aligned
+            offset += padding
+            table.extend([offset, len(data)])
+            sections.extend([b'\0' * padding, data])
+            offset += len(data)
+        tmp = '{}.tmp'.format(path)
+        with open(tmp, 'wb') as f:
+            f.write(_INDEX_HEADER.pack(
+                INDEX_MAGIC, INDEX_VERSION, years[0], years[-1], len(names),
+                len(history.author_table), len(columns['author_ids'])))
+            f.write(_INDEX_SECTIONS.pack(*table))
+            for section in sections:
+                f.write(section)
+        _os.replace(tmp, path)
+        return cls(path)
+
+    def dump(self, stream):
+        """Like `HistoryStore.dump`."""
+        paths = []
+        offsets = self._path_offsets
+        for i in range(self._count):
+            paths.append(self._path_names[offsets[i]:offsets[i+1]].tobytes(
+                    ).decode('utf-8'))
+        _dump_snapshot(
+            stream, commits=self.commits, paths=paths,
+            authors=[self.author(id) for id in range(self._author_count)],
+            min_years=_array.array('H', self._min_years),
+            max_years=_array.array('H', self._max_years),
+            offsets=_array.array('I', self._author_offsets),
+            author_ids=_array.array('I', self._author_ids))
+
+    def _find(self, path):
+        key = path.encode('utf-8')
+        offsets = self._path_offsets
+        names = self._path_names
+        low,high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if names[offsets[middle]:offsets[middle+1]].tobytes() < key:
+                low = middle + 1
+            else:
+                high = middle
+        if (low < self._count and
+                names[offsets[low]:offsets[low+1]].tobytes() == key):
+            return low
+        return None
+
+    def author(self, id):
+        offsets = self._author_name_offsets
+        return self._author_names[offsets[id]:offsets[id+1]].tobytes(
+            ).decode('utf-8')
+
+    def years(self, path=None):
+        """Like `HistoryStore.years`."""
+        if path is None:
+            if not self._count:
+                return set()
+            return set([self._first_year, self._last_year])
+        i = self._find(path)
+        if i is None:
+            return set()
+        return set([self._min_years[i], self._max_years[i]])
+
+    def author_ids(self, path):
+        """Return a (zero-copy) view of the author IDs of `path`."""
+        i = self._find(path)
+        if i is None:
+            return []
+        return self._author_ids[
+            self._author_offsets[i]:self._author_offsets[i+1]]
+
+    def authors(self, path=None):
+        """Like `HistoryStore.authors`."""
+        if path is None:
+            return set(self.author(id) for id in range(self._author_count))
+        ids = self.author_ids(path)
+        try:
+            return set(self.author(id) for id in ids)
+        finally:
+            if isinstance(ids, memoryview):
+                ids.release()
@@ -0,0 +1,175 @@
+# Copyright (C) 2014 W. Trevor King <wking@tremily.us>
+#
+# This file is part of update-copyright.
+#
+# update-copyright is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# update-copyright is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# update-copyright.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Remember finished files so interrupted runs can resume.
+
+A `Journal` appends one line of JSON for each file `Project.update_files`
+finishes, recording the history fingerprint (see
+`Project.history_fingerprint`) the file was checked against and the
+file's size and modification time afterwards.  A resumed run skips
+the files whose entry matches the current fingerprint and whose size
+and modification time are unchanged.  Every other file (unfinished,
+edited since, or checked against different history or configuration)
+is processed again.
+"""
+
+import json as _json
+import os as _os
+import threading as _threading
+
+from . import LOG as _LOG
+from .utils import relative_path as _relative_path
+
+
+VERSION = 1
+
+
+def file_state(filename):
+    """Return ``(size, mtime_ns)`` for `filename`, or ``None`` if missing."""
+    try:
+        stat = _os.stat(filename)
+    except (IOError, OSError):
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+class Journal (object):
+    """Append-only record of finished files at `path`.
+
+    With `resume`, entries already in the journal are loaded and
+    honored.  Otherwise the journal is truncated.  Paths are
+    relative to `root`.
+
+    >>> import os, tempfile
+    >>> root = tempfile.mkdtemp()
+    >>> a = os.path.join(root, 'a.py')
+    >>> with open(a, 'w') as f:
+    ...     _ = f.write('x = 1\\n')
+    >>> path = os.path.join(root, 'journal')
+    >>> journal = Journal(path, fingerprint='abc', root=root)
+    >>> journal.record(a, result='changed')
+    >>> journal.close()
+    >>> Journal(path, fingerprint='abc', root=root, resume=True).done(a)
+    True
+    >>> Journal(path, fingerprint='def', root=root, resume=True).done(a)
+    False
+    >>> with open(a, 'a') as f:
+    ...     _ = f.write('y = 2\\n')
+    >>> Journal(path, fingerprint='abc', root=root, resume=True).done(a)
+    False
+    >>> Journal(path, fingerprint='abc', root=root).done(a)
+    False
+
+    A line torn by an interruption is dropped before new entries are
+    appended, so they start on a line of their own.
+
+    >>> b = os.path.join(root, 'b.py')
+    >>> with open(b, 'w') as f:
+    ...     _ = f.write('z = 3\\n')
+    >>> with open(path, 'a') as f:
+    ...     _ = f.write('{"path": "b.py", "fing')
+    >>> journal = Journal(path, fingerprint='abc', root=root, resume=True)
+    >>> journal.record(b, result='changed')
+    >>> journal.close()
+    >>> Journal(path, fingerprint='abc', root=root, resume=True).done(b)
+    True
+    """
+    def __init__(self, path, fingerprint, root='.', resume=False):
+        self.path = path
+        self.fingerprint = fingerprint
+        self._root = root
+        self._entries = {}
+        self._lock = _threading.Lock()
+        if resume:
+            self._load()
+            self._truncate_torn_line()
+        mode = 'a' if resume else 'w'
+        self._stream = open(path, mode)
+        self.resumed = len(self._entries)
+
+    def _load(self):
+        try:
+            stream = open(self.path, 'r')
+        except (IOError, OSError):
+            return
+        with stream:
+            for i,line in enumerate(stream):
+                try:
+                    entry = _json.loads(line)
+                except ValueError:
+                    # probably a line torn by the interruption
+                    _LOG.warning('ignoring line {} of journal {}'.format(
+                        i + 1, self.path))
+                    continue
+                if (entry.get('version') == VERSION and
+                        entry.get('fingerprint') == self.fingerprint):
+                    self._entries[entry['path']] = entry
+                else:
+                    self._entries.pop(entry.get('path'), None)
+
+    def _truncate_torn_line(self, chunk_size=4096):
+        """Cut the journal back to the end of its last complete line."""
+        try:
+            stream = open(self.path, 'r+b')
+        except (IOError, OSError):
+            return
+        with stream:
+            size = end = stream.seek(0, _os.SEEK_END)
+            while end > 0:
+                start = max(0, end - chunk_size)
+                stream.seek(start)
+                i = stream.read(end - start).rfind(b'\n')
+                if i >= 0:
+                    end = start + i + 1
+                    break
+                end = start
+            if end < size:
+                _LOG.warning('truncating torn last line of journal {}'.format(
+                    self.path))
+                stream.truncate(end)
+
+    def done(self, filename):
+        """Return true if `filename` was finished and is unchanged since."""
+        entry = self._entries.get(_relative_path(filename, self._root))
+        if entry is None:
+            return False
+        state = file_state(filename)
+        return state is not None and list(state) == entry['state']
+
+    def record(self, filename, result):
+        """Record that `filename` is finished.
+
+        `result` is ``'changed'``, ``'unchanged'``, or the reason the
+        file was skipped.
+        """
+        state = file_state(filename)
+        if state is None:
+            return
+        line = _json.dumps({
+                'version': VERSION,
+                'path': _relative_path(filename, self._root),
+                'fingerprint': self.fingerprint,
+                'result': result,
+                'state': list(state),
+                }, sort_keys=True)
+        with self._lock:
+            self._stream.write(line + '\n')
+            self._stream.flush()
+
+    def close(self):
+        with self._lock:
+            self._stream.close()
@@ -0,0 +1,65 @@
+# Copyright (C) 2014 W. Trevor King <wking@tremily.us>
+#
+# This file is part of update-copyright.
+#
+# update-copyright is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# update-copyright is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# update-copyright.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Defer module imports until the module is actually used.
+
+Most runs (e.g. a commit hook touching a single file) only need a
+fraction of the standard library modules this package uses, so
+importing them up front dominates startup time.  Like `log`, this
+module has no internal dependencies.
+"""
+
+import importlib as _importlib
+import importlib.util as _importlib_util
+import sys as _sys
+import types as _types
+
+
+class _LazyModule (_types.ModuleType):
+    """Stand-in for a module that imports it on first attribute access.
+
+    Every attribute access is forwarded to the real module.  Unlike
+    `importlib.util.LazyLoader` (before Python 3.12.3), first accesses
+    from several threads may race safely, since
+    `importlib.import_module` holds the module's import lock.
+    """
+    def __getattr__(self, attr):
+        return getattr(_importlib.import_module(self.__name__), attr)
+
+
+def lazy_import(name, package=None):
+    """Return the module `name`, executing it on first attribute access.
+
+    Relative names are resolved against `package`.  Raises
+    `ImportError` right away if the module cannot be found.
+
+    >>> textwrap = lazy_import('textwrap')
+    >>> textwrap.fill('a b', width=1)
+    'a\\nb'
+    >>> lazy_import('no_such_module_xyz')
+    Traceback (most recent call last):
+      ...
+    ImportError: No module named 'no_such_module_xyz'
+    """
+    name = _importlib_util.resolve_name(name, package)
+    try:
+        return _sys.modules[name]
+    except KeyError:
+        pass
+    if _importlib_util.find_spec(name) is None:
+        raise ImportError('No module named {!r}'.format(name), name=name)
+    return _LazyModule(name)
@@ -0,0 +1,287 @@
+# Copyright (C) 2014 W. Trevor King <wking@tremily.us>
+#
+# This file is part of update-copyright.
+#
+# update-copyright is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# update-copyright is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# update-copyright.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Run items through stages of worker threads joined by bounded queues.
+
+Each `Stage` has its own pool of threads, so a slow stage (e.g. VCS
+history lookups, which wait on subprocesses) does not hold up the
+others (e.g. disk reads and writes), and the bounded queues keep only
+a few items in flight between stages.  `Project.update_files` uses a
+pipeline with the stages in `STAGES`, fed by a generator that lists
+the files and filters out the ones that are cheap to rule out.
+"""
+
+import queue as _queue
+import threading as _threading
+import time as _time
+
+
+# the stages of `Project.update_files`, in order
+STAGES = ('filter', 'read', 'history', 'render', 'write')
+
+# default number of worker threads for each of `STAGES`
+WORKERS = {
+    'filter': 4,
+    'read': 2,
+    'history': 4,
+    'render': 1,
+    'write': 2,
+    }
+
+# default reorder window of `Project.update_files`
+WINDOW = 128
+
+# end-of-input marker, also returned by `Pipeline._get` after a stop
+_DONE = object()
+
+
+class Stage (object):
+    """Apply `fn` to each item with `workers` threads.
+
+    `fn` returns the item to pass to the next stage, or ``None`` to
+    drop it.  `items` and `busy` (seconds spent in `fn`, summed over
+    the workers) are updated as the pipeline runs.
+    """
+    def __init__(self, name, fn, workers=1):
+        if workers < 1:
+            raise ValueError('{} stage needs at least one worker'.format(
+                name))
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.items = 0
+        self.busy = 0
+        self._lock = _threading.Lock()
+
+    def __repr__(self):
+        return '<{} {} x{}: {} items, {:.2f} s busy>'.format(
+            type(self).__name__, self.name, self.workers, self.items,
+            self.busy)
+
+    def __call__(self, item):
+        start = _time.time()
+        try:
+            return self.fn(item)
+        finally:
+            with self._lock:
+                self.items += 1
+                self.busy += _time.time() - start
+
+
+class Pipeline (object):
+    """Connect `stages` with queues holding up to `queue_size` items.
+
+    >>> pipeline = Pipeline([
+    ...     Stage('double', lambda x: 2 * x, workers=3),
+    ...     Stage('odd', lambda x: x if x % 4 else None, workers=2),
+    ...     ])
+    >>> sorted(pipeline.run(range(6)))
+    [2, 6, 10]
+    >>> pipeline.stages[0]  # doctest: +ELLIPSIS
+    <Stage double x3: 6 items, ... s busy>
+
+    With a `window`, outputs are yielded in source order, although
+    the stages still finish items in any order.  The source is held
+    back so no item starts more than `window` items after the oldest
+    one not yet yielded, which bounds the items waiting to be
+    reordered.
+
+    >>> import time
+    >>> started = []
+    >>> written = []
+    >>> def source():
+    ...     for x in range(6):
+    ...         started.append(x)
+    ...         yield x
+    >>> def slow(x):
+    ...     if x == 0:
+    ...         time.sleep(0.2)
+    ...         return (x, len(started))
+    ...     return (x, None)
+    >>> def write(item):
+    ...     written.append(item[0])
+    ...     return item if item[0] % 2 == 0 else None
+    >>> list(Pipeline([
+    ...     Stage('slow', slow, workers=3),
+    ...     Stage('write', write, workers=2),
+    ...     ], window=3).run(source()))
+    [(0, 3), (2, None), (4, None)]
+    >>> sorted(written[:2]), written[2]
+    ([1, 2], 0)
+
+    The first exception raised by a stage (or by the source) stops
+    the pipeline and is re-raised by `run`.
+
+    >>> list(Pipeline([Stage('fail', lambda x: 1 // x)]).run([1, 0, 2]))
+    Traceback (most recent call last):
+      ...
+    ZeroDivisionError: integer division or modulo by zero
+    """
+    def __init__(self, stages, queue_size=16, window=None, poll=0.1):
+        self.stages = list(stages)
+        self._queue_size = queue_size
+        self._window = window
+        self._poll = poll
+        self._stop = _threading.Event()
+        self._lock = _threading.Lock()
+        self._error = None
+        self._remaining = None
+        self._slots = None
+
+    def _fail(self, error):
+        with self._lock:
+            if self._error is None:
+                self._error = error
+        self._stop.set()
+
+    def _put(self, queue, item):
+        while not self._stop.is_set():
+            try:
+                queue.put(item, timeout=self._poll)
+            except _queue.Full:
+                continue
+            return True
+        return False
+
+    def _get(self, queue):
+        while not self._stop.is_set():
+            try:
+                return queue.get(timeout=self._poll)
+            except _queue.Empty:
+                continue
+        return _DONE
+
+    def _acquire_slot(self):
+        """Wait until the reorder window has room for another item."""
+        if self._slots is None:
+            return True
+        while not self._stop.is_set():
+            if self._slots.acquire(timeout=self._poll):
+                return True
+        return False
+
+    def _finish_input(self, index, queue):
+        """Tell the workers of stage `index` that no more input is coming."""
+        if index < len(self.stages):
+            workers = self.stages[index].workers
+        else:
+            workers = 1  # the consumer in `run`
+        for i in range(workers):
+            self._put(queue, _DONE)
+
+    def _feed(self, source, queue):
+        # wait for a window slot before taking the next item, so the
+        # source does no work for items that could not start yet
+        items = enumerate(source)
+        try:
+            while self._acquire_slot():
+                try:
+                    item = next(items)
+                except StopIteration:
+                    break
+                if not self._put(queue, item):
+                    return
+            else:
+                return
+        except BaseException as e:
+            self._fail(e)
+            return
+        self._finish_input(0, queue)
+
+    def _work(self, index, input, output):
+        # Items travel between stages as ``(position, item)`` pairs,
+        # where `position` is the index of the item in the source, and
+        # dropped items are passed on as ``(position, None)``, so
+        # `run` knows which positions to wait for when reordering.
+        stage = self.stages[index]
+        while True:
+            got = self._get(input)
+            if got is _DONE:
+                break
+            position,item = got
+            if item is not None:
+                try:
+                    item = stage(item)
+                except BaseException as e:
+                    self._fail(e)
+                    return
+            if not self._put(output, (position, item)):
+                return
+        with self._lock:
+            self._remaining[index] -= 1
+            last = self._remaining[index] == 0
+        if last:
+            self._finish_input(index + 1, output)
+
+    def _outputs(self, queue):
+        """Generate ``(position, item)`` pairs as the last stage outputs them.
+
+        With a `window`, reorder them by position, freeing a window
+        slot for each.
+        """
+        pending = {}
+        position = 0
+        while True:
+            got = self._get(queue)
+            if got is _DONE:
+                return
+            if self._slots is None:
+                yield got
+                continue
+            pending[got[0]] = got[1]
+            while position in pending:
+                yield (position, pending.pop(position))
+                position += 1
+                self._slots.release()
+
+    def run(self, source):
+        """Generate the output of the last stage for each item of `source`.
+
+        `source` is iterated in its own thread.  Without a `window`,
+        outputs may arrive in any order if any stage has more than one
+        worker.
+        """
+        self._stop.clear()
+        self._error = None
+        self._remaining = [stage.workers for stage in self.stages]
+        self._slots = None
+        if self._window is not None:
+            self._slots = _threading.BoundedSemaphore(self._window)
+        queues = [_queue.Queue(maxsize=self._queue_size)
+                  for i in range(len(self.stages) + 1)]
+        threads = [_threading.Thread(
+                target=self._feed, args=(source, queues[0]),
+                name='pipeline-source')]
+        for index,stage in enumerate(self.stages):
+            for i in range(stage.workers):
+                threads.append(_threading.Thread(
+                        target=self._work,
+                        args=(index, queues[index], queues[index + 1]),
+                        name='pipeline-{}-{}'.format(stage.name, i)))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            for position,item in self._outputs(queues[-1]):
+                if item is not None:
+                    yield item
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+        if self._error is not None:
+            raise self._error
@@ -0,0 +1,156 @@
+# Copyright (C) 2014 W. Trevor King <wking@tremily.us>
+#
+# This file is part of update-copyright.
+#
+# update-copyright is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# update-copyright is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# update-copyright.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Choose between per-file history queries and a full history scan.
+
+Per-file queries (e.g. ``git log --follow -- path``) cost a process
+spawn and a path-limited walk of the history, several times for each
+file.  A scan walks the history once, but lists the paths changed by
+every commit.  `choose` estimates both from the number of files and
+commits and picks the cheaper one.
+
+Both follow renames (see `vcs.git.GitBackend`), so they give the same
+history and callers let `choose` pick (``'auto'``) by default.
+"""
+
+
+PER_FILE = 'per-file'
+SCAN = 'scan'
+INDEXED = 'indexed'
+
+# accepted `choose` strategies; `INDEXED` is only ever chosen
+STRATEGIES = ('auto', PER_FILE, SCAN)
+
+# Rough costs in seconds.  Only their ratios matter.
+SPAWN_COST = 5e-3
+WALK_COST = 2e-6  # per commit, for a path-limited walk
+SCAN_COST = 3e-5  # per commit, for a walk listing changed paths
+QUERIES_PER_FILE = 3  # years, authors, and is_versioned
+
+
+class HistoryPlan (object):
+    """How history will be looked up, and why.
+
+    `per_file_cost` and `scan_cost` are the estimates in seconds
+    (``None`` if not estimated).
+    """
+    def __init__(self, strategy, files, commits=None, per_file_cost=None,
+                 scan_cost=None, reason=''):
+        self.strategy = strategy
+        self.files = files
+        self.commits = commits
+        self.per_file_cost = per_file_cost
+        self.scan_cost = scan_cost
+        self.reason = reason
+
+    def __repr__(self):
+        return '<{} {}: {}>'.format(
+            type(self).__name__, self.strategy, self.reason)
+
+    def as_dict(self):
+        return {
+            'strategy': self.strategy,
+            'files': self.files,
+            'commits': self.commits,
+            'per_file_cost': self.per_file_cost,
+            'scan_cost': self.scan_cost,
+            'reason': self.reason,
+            }
+
+
+def estimate(files, commits):
+    """Return the estimated ``(per_file_cost, scan_cost)`` in seconds.
+
+    >>> per_file,scan = estimate(files=2, commits=100000)
+    >>> per_file < scan
+    True
+    >>> per_file,scan = estimate(files=30000, commits=100000)
+    >>> per_file > scan
+    True
+    """
+    per_file = files * QUERIES_PER_FILE * (SPAWN_COST + commits * WALK_COST)
+    scan = SPAWN_COST + commits * SCAN_COST
+    return (per_file, scan)
+
+def needs_commit_count(files):
+    """Return true if the choice for `files` files depends on the history.
+
+    Each commit costs per-file queries ``files * QUERIES_PER_FILE *
+    WALK_COST``, so beyond a few files a scan is cheaper however long
+    the history is, and counting the commits would be wasted effort.
+
+    >>> needs_commit_count(2), needs_commit_count(30000)
+    (True, False)
+    """
+    return 0 < files and files * QUERIES_PER_FILE * WALK_COST < SCAN_COST
+
+def choose(files, commits=None, strategy='auto', indexed=False,
+           can_scan=True):
+    """Return a `HistoryPlan` for looking up the history of `files` files.
+
+    `commits` is the number of commits a scan would read (``None`` if
+    unknown), `indexed` is true if the history is already indexed,
+    and `can_scan` is false for backends that cannot scan.  Pass a
+    `strategy` other than ``'auto'`` to override the choice.
+
+    >>> choose(files=2, commits=100000)
+    <HistoryPlan per-file: estimated 1.23 s per-file vs 3.00 s scan>
+    >>> choose(files=2, commits=100)
+    <HistoryPlan scan: estimated 0.03 s per-file vs 0.01 s scan>
+    >>> choose(files=30000)
+    <HistoryPlan scan: cheaper for 30000 files at any history length>
+    >>> choose(files=0)
+    <HistoryPlan per-file: no files>
+    >>> choose(files=2, commits=100000, strategy='scan')
+    <HistoryPlan scan: requested>
+    >>> choose(files=30000, indexed=True)
+    <HistoryPlan indexed: history already indexed>
+    >>> choose(files=30000, can_scan=False)
+    <HistoryPlan per-file: backend cannot scan>
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError('unknown history strategy {!r} (expected one of {})'
+                         .format(strategy, ', '.join(STRATEGIES)))
+    if indexed:
+        return HistoryPlan(
+            INDEXED, files=files, reason='history already indexed')
+    if strategy != 'auto':
+        return HistoryPlan(
+            strategy, files=files, commits=commits, reason='requested')
+    if not can_scan:
+        return HistoryPlan(
+            PER_FILE, files=files, reason='backend cannot scan')
+    if files == 0:
+        return HistoryPlan(PER_FILE, files=files, reason='no files')
+    if not needs_commit_count(files):
+        return HistoryPlan(
+            SCAN, files=files, commits=commits,
+            reason='cheaper for {} files at any history length'.format(
+                files))
+    if commits is None:
+        return HistoryPlan(
+            PER_FILE, files=files, reason='unknown commit count')
+    per_file,scan = estimate(files=files, commits=commits)
+    if scan < per_file:
+        chosen = SCAN
+    else:
+        chosen = PER_FILE
+    return HistoryPlan(
+        chosen, files=files, commits=commits, per_file_cost=per_file,
+        scan_cost=scan,
+        reason='estimated {:.2f} s per-file vs {:.2f} s scan'.format(
+            per_file, scan))
@@ -0,0 +1,231 @@
+# Copyright (C) 2014 W. Trevor King <wking@tremily.us>
+#
+# This file is part of update-copyright.
+#
+# update-copyright is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# update-copyright is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# update-copyright.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Report the progress of long runs.
+
+`Project.plan_files` and `Project.update_files` call the hooks of a
+`Progress` instance as they work through the project.  `Terminal`
+draws a live count with an ETA, and `EventStream` writes one JSON
+object per event for machine consumption.
+"""
+
+import json as _json
+import sys as _sys
+import threading as _threading
+import time as _time
+
+
+class Progress (object):
+    """Do-nothing base class documenting the progress hooks.
+
+    Hooks may be called from several threads.
+    """
+    def start(self, total):
+        """Called once, with the number of candidate files."""
+        pass
+
+    def history_plan(self, plan):
+        """Called with the `planner.HistoryPlan` chosen for the run."""
+        pass
+
+    def file_start(self, path):
+        pass
+
+    def file_skip(self, path, reason):
+        pass
+
+    def file_finish(self, path, edit=False):
+        """Called after `path` was checked.
+
+        `edit` is true if the file needs changing.
+        """
+        pass
+
+    def file_change(self, path):
+        """Called after a planned edit to `path` was applied."""
+        pass
+
+    def finish(self):
+        pass
+
+
+class Group (Progress):
+    """Forward every hook to each of several `Progress` instances."""
+    def __init__(self, members):
+        self.members = list(members)
+
+    def _forward(name):
+        def hook(self, *args, **kwargs):
+            for member in self.members:
+                getattr(member, name)(*args, **kwargs)
+        hook.__name__ = name
+        return hook
+
+    start = _forward('start')
+    history_plan = _forward('history_plan')
+    file_start = _forward('file_start')
+    file_skip = _forward('file_skip')
+    file_finish = _forward('file_finish')
+    file_change = _forward('file_change')
+    finish = _forward('finish')
+    del _forward
+
+
+def format_duration(seconds):
+    """
+    >>> format_duration(5.2)
+    '0:05'
+    >>> format_duration(3725)
+    '1:02:05'
+    """
+    minutes,seconds = divmod(int(seconds), 60)
+    hours,minutes = divmod(minutes, 60)
+    if hours:
+        return '{}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+    return '{}:{:02d}'.format(minutes, seconds)
+
+
+class Terminal (Progress):
+    """Draw ``done/total`` with an ETA on a terminal.
+
+    Nothing is drawn unless `stream` is a TTY.  Redraws are limited to
+    one every `interval` seconds.
+    """
+    def __init__(self, stream=None, interval=0.2):
+        if stream is None:
+            stream = _sys.stderr
+        self._stream = stream
+        self._enabled = stream.isatty()
+        self._interval = interval
+        self._lock = _threading.Lock()
+        self._total = 0
+        self._done = 0
+        self._changed = 0
+        self._start = None
+        self._last_draw = 0
+
+    def start(self, total):
+        with self._lock:
+            self._total = total
+            self._start = _time.time()
+        self._draw(force=True)
+
+    def file_skip(self, path, reason):
+        with self._lock:
+            self._done += 1
+        self._draw()
+
+    def file_finish(self, path, edit=False):
+        with self._lock:
+            self._done += 1
+            if edit:
+                self._changed += 1
+        self._draw()
+
+    def finish(self):
+        self._draw(force=True)
+        if self._enabled:
+            self._stream.write('\n')
+            self._stream.flush()
+
+    def _draw(self, force=False):
+        if not self._enabled:
+            return
+        with self._lock:
+            now = _time.time()
+            if not force and now - self._last_draw < self._interval:
+                return
+            self._last_draw = now
+            elapsed = now - (self._start or now)
+            line = '{}/{} files, {} to change, {} elapsed'.format(
+                self._done, self._total, self._changed,
+                format_duration(elapsed))
+            if 0 < self._done < self._total:
+                remaining = elapsed * (self._total - self._done) / self._done
+                line += ', ETA {}'.format(format_duration(remaining))
+            self._stream.write('\r{}\x1b[K'.format(line))
+            self._stream.flush()
+
+
+class EventStream (Progress):
+    """Write each event as a line of JSON to `stream`.
+
+    Every event has ``event`` and ``time`` (seconds since the epoch)
+    fields.  Per-file events also have ``path``, and ``finish`` events
+    have ``duration`` (seconds spent checking the file) and ``edit``.
+
+    >>> import io
+    >>> stream = io.StringIO()
+    >>> events = EventStream(stream, clock=lambda: 10.0)
+    >>> events.start(total=2)
+    >>> from .planner import HistoryPlan
+    >>> events.history_plan(HistoryPlan('indexed', files=2, reason='cached'))
+    >>> events.file_skip('a', reason='binary')
+    >>> events.file_start('b')
+    >>> events.file_finish('b', edit=True)
+    >>> events.file_change('b')
+    >>> events.finish()
+    >>> print(stream.getvalue(), end='')
+    {"event": "run-start", "time": 10.0, "total": 2}
+    {"commits": null, "event": "history-plan", "files": 2, "per_file_cost": null, "reason": "cached", "scan_cost": null, "strategy": "indexed", "time": 10.0}
+    {"event": "skip", "path": "a", "reason": "binary", "time": 10.0}
+    {"event": "start", "path": "b", "time": 10.0}
+    {"duration": 0.0, "edit": true, "event": "finish", "path": "b", "time": 10.0}
+    {"event": "change", "path": "b", "time": 10.0}
+    {"duration": 0.0, "event": "run-finish", "time": 10.0}
+    """
+    def __init__(self, stream, clock=_time.time):
+        self._stream = stream
+        self._clock = clock
+        self._lock = _threading.Lock()
+        self._starts = {}
+        self._start = None
+
+    def _emit(self, event, **kwargs):
+        kwargs['event'] = event
+        kwargs['time'] = self._clock()
+        line = _json.dumps(kwargs, sort_keys=True)
+        with self._lock:
+            self._stream.write(line + '\n')
+            self._stream.flush()
+        return kwargs['time']
+
+    def start(self, total):
+        self._start = self._emit('run-start', total=total)
+
+    def history_plan(self, plan):
+        self._emit('history-plan', **plan.as_dict())
+
+    def file_start(self, path):
+        self._starts[path] = self._emit('start', path=path)
+
+    def file_skip(self, path, reason):
+        self._starts.pop(path, None)
+        self._emit('skip', path=path, reason=reason)
+
+    def file_finish(self, path, edit=False):
+        start = self._starts.pop(path, None)
+        now = self._clock()
+        duration = 0 if start is None else now - start
+        self._emit('finish', path=path, duration=duration, edit=bool(edit))
+
+    def file_change(self, path):
+        self._emit('change', path=path)
+
+    def finish(self):
+        now = self._clock()
+        self._emit('run-finish', duration=now - (self._start or now))
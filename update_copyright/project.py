@@ -17,19 +17,31 @@
 
 """Project-specific configuration."""
 
-import configparser as _configparser
 import fnmatch as _fnmatch
+import json as _json
+import os as _os
 import os.path as _os_path
-import sys
+import threading as _threading
 import time as _time
 
 from . import LOG as _LOG
+from . import __version__ as _version
+from . import planner as _planner
 from . import utils as _utils
-from .vcs.git import GitBackend as _GitBackend
-try:
-    from .vcs.mercurial import MercurialBackend as _MercurialBackend
-except ImportError as _mercurial_import_error:
-    _MercurialBackend = None
+from .classify import FileClassifier as _FileClassifier
+from .edit import Edit as _Edit
+from .lazy import lazy_import as _lazy_import
+from .progress import Progress as _Progress
+
+_configparser = _lazy_import('configparser')
+_hacks = _lazy_import('.hacks', package=__package__)
+_hashlib = _lazy_import('hashlib')
+_history = _lazy_import('.history', package=__package__)
+_pipeline = _lazy_import('.pipeline', package=__package__)
+_shard = _lazy_import('.shard', package=__package__)
+
+
+_PREFIXES = [('# ', '# ', None), ('/* ', ' * ', ' */')]
 
 
 class Project (object):
@@ -46,17 +58,29 @@ class Project (object):
         self.with_authors = False
         self.with_files = False
         self._ignored_paths = None
+        self._classifier = None
         self._pyfile = None
         self._encoding = None
         self._width = 79
-
-        # unlikely to occur in the wild :p
-        self._copyright_tag = '-xyz-COPY' + '-RIGHT-zyx-'
+        self._skip_generated = False
+        # files larger than this only have their leading `_head_size`
+        # bytes decoded and rewritten
+        self._large_file_size = 2**20
+        self._head_size = 2**16
+        self._batch_size = 64
+        self._config_digest = None
+        self._vcs_options = None
+        self._bodies = {}
+        self._lock = _threading.Lock()
 
     def load_config(self, stream):
         parser = _configparser.RawConfigParser()
         parser.optionxform = str
-        parser.readfp(stream)
+        parser.read_file(stream)
+        self._config_digest = _hashlib.sha1(_json.dumps(
+                [[section, sorted(parser.items(section))]
+                 for section in sorted(parser.sections())]).encode('utf-8')
+            ).hexdigest()
         for section in parser.sections():
             clean_section = section.replace('-', '_')
             try:
@@ -65,6 +89,29 @@ class Project (object):
                 _LOG.error('invalid {} section'.format(section))
                 raise
             loader(parser=parser)
+        self._configure_vcs()
+
+    def _configure_vcs(self):
+        """Hand the final hacks and aliases to the VCS backend.
+
+        A backend configured by ``[project]`` is only created here,
+        once every section is loaded, so its configuration is fixed
+        for its whole life and lookups from several threads never see
+        a half-applied configuration.
+        """
+        kwargs = {
+            'author_hacks': self._author_hacks,
+            'year_hacks': self._year_hacks,
+            'aliases': self._aliases,
+            }
+        if self._vcs_options is not None:
+            backend,options = self._vcs_options
+            self._vcs_options = None
+            options.update(kwargs)
+            self._vcs = backend(root=self._root, **options)
+            self._classifier = None
+        elif self._vcs is not None:
+            self._vcs.configure(**kwargs)
 
     def _load_project_conf(self, parser):
         try:
@@ -76,18 +123,36 @@ class Project (object):
         except _configparser.NoOptionError:
             pass
         else:
-            kwargs = {
-                'root': self._root,
-                'author_hacks': self._author_hacks,
-                'year_hacks': self._year_hacks,
-                'aliases': self._aliases,
-                }
+            blame = False
+            try:
+                blame = parser.getboolean('project', 'blame')
+            except _configparser.NoOptionError:
+                pass
+            try:
+                ignore_revs_file = parser.get('project', 'ignore-revs-file')
+            except _configparser.NoOptionError:
+                ignore_revs_file = None
+            commit_graph = False
+            try:
+                commit_graph = parser.getboolean('project', 'commit-graph')
+            except _configparser.NoOptionError:
+                pass
+            # backends are only imported once they are configured, and
+            # created by `_configure_vcs`
             if vcs == 'Git':
-                self._vcs = _GitBackend(**kwargs)
+                from .vcs.git import GitBackend
+                self._vcs_options = (GitBackend, {
+                        'blame': blame,
+                        'ignore_revs_file': ignore_revs_file,
+                        'write_commit_graph': commit_graph,
+                        })
             elif vcs == 'Mercurial':
-                if _MercurialBackend is None:
-                    raise _mercurial_import_error
-                self._vcs = _MercurialBackend(**kwargs)
+                if blame or ignore_revs_file:
+                    raise NotImplementedError('blame authors for Mercurial')
+                if commit_graph:
+                    raise NotImplementedError('commit-graph for Mercurial')
+                from .vcs.mercurial import MercurialBackend
+                self._vcs_options = (MercurialBackend, {})
             else:
                 raise NotImplementedError('vcs: {}'.format(vcs))
 
@@ -121,6 +186,10 @@ class Project (object):
             pass
         else:
             self._ignored_paths = [pth.strip() for pth in ignored.split('|')]
+        try:
+            self._skip_generated = not parser.getboolean('files', 'generated')
+        except _configparser.NoOptionError:
+            pass
         try:
             pyfile = parser.get('files', 'pyfile')
         except _configparser.NoOptionError:
@@ -129,23 +198,18 @@ class Project (object):
             self._pyfile = _os_path.join(self._root, pyfile)
 
     def _load_author_hacks_conf(self, parser):
-        author_hacks = {}
+        author_hacks = _hacks.PathTrie()
         for path in parser.options('author-hacks'):
             authors = parser.get('author-hacks', path)
-            author_hacks[tuple(path.split('/'))] = set(
-                a.strip() for a in authors.split('|'))
+            author_hacks.add(path, set(a.strip() for a in authors.split('|')))
         self._author_hacks = author_hacks
-        if self._vcs is not None:
-            self._vcs._author_hacks = self._author_hacks
 
     def _load_year_hacks_conf(self, parser):
-        year_hacks = {}
+        year_hacks = _hacks.PathTrie()
         for path in parser.options('year-hacks'):
             year = parser.get('year-hacks', path)
-            year_hacks[tuple(path.split('/'))] = int(year)
+            year_hacks.add(path, [int(year)])
         self._year_hacks = year_hacks
-        if self._vcs is not None:
-            self._vcs._year_hacks = self._year_hacks
 
     def _load_aliases_conf(self, parser):
         aliases = {}
@@ -154,8 +218,6 @@ class Project (object):
             aliases[author] = set(
                 a.strip() for a in _aliases.split('|'))
         self._aliases = aliases
-        if self._vcs is not None:
-            self._vcs._aliases = self._aliases
 
     def _info(self):
         return {
@@ -163,48 +225,593 @@ class Project (object):
             'vcs': self._vcs.name,
             }
 
-    def update_authors(self, dry_run=False):
+    def index_history(self, snapshot=None):
+        """Load the whole VCS history up front.
+
+        This replaces the per-file history queries made by
+        `update_file` with a single scan, which is much faster when
+        updating most of a large project.  If `snapshot` is the path
+        to a file written by `save_history`, start from it and only
+        scan the commits made since.  Missing or corrupt snapshots
+        are ignored with a warning.  Raises `NotImplementedError` if
+        the backend cannot scan its history (e.g. Mercurial).
+        """
+        self._index_history(base=self._load_history_snapshot(snapshot))
+
+    def _load_history_snapshot(self, snapshot):
+        if snapshot is None:
+            return None
+        try:
+            with open(snapshot, 'rb') as f:
+                base = _history.HistoryStore.load(f)
+        except (IOError, OSError, ValueError) as e:
+            _LOG.warning('ignoring history snapshot {} ({})'.format(
+                snapshot, e))
+            return None
+        _LOG.info('loaded history snapshot {} at {}'.format(
+            snapshot, base.commits.get('')))
+        return base
+
+    def publish_history(self, path):
+        """Publish the indexed history as a `history.SharedIndex` at `path`.
+
+        Calls `index_history` first, if needed.  Worker processes
+        can then `attach_history` to share the index instead of each
+        querying the VCS or unpickling their own copy.
+        """
+        if self._vcs._history is None:
+            self.index_history()
+        _LOG.info('publish history index {}'.format(path))
+        return _history.SharedIndex.publish(self._vcs._history, path)
+
+    def attach_history(self, index):
+        """Answer history queries from a published `history.SharedIndex`.
+
+        `index` is the index or the path it was published at.
+        """
+        if not isinstance(index, _history.SharedIndex):
+            index = _history.SharedIndex(index)
+        self._vcs._history = index
+
+    def history_fingerprint(self, strategy='auto'):
+        """Return a digest of everything a file's new blurb depends on.
+
+        That is the VCS revision, the configuration, the history
+        `strategy` (as for `plan_history`), and the version of this
+        package.
+        """
+        digest = _hashlib.sha1()
+        for part in [_version, self._config_digest, self._vcs.revision(),
+                     strategy]:
+            digest.update('{}\n'.format(part).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _index_history(self, base=None):
+        _LOG.info('index {} history'.format(self._vcs.name))
+        self._vcs.index_history(base=base)
+
+    def plan_history(self, files, strategy='auto', snapshot=None):
+        """Choose how to look up the history of `files` files.
+
+        Returns a `planner.HistoryPlan`.  If it is a scan, the history
+        is indexed (starting from `snapshot`, as for `index_history`)
+        before returning.  If per-file queries remain (per-file plans,
+        or blame authors), the backend gets to `prepare_queries`
+        first.  `strategy` is one of `planner.STRATEGIES`.
+        """
+        indexed = self._vcs._history is not None
+        can_scan = self._vcs.can_index_history
+        base = commits = None
+        if not indexed and can_scan and strategy != _planner.PER_FILE:
+            base = self._load_history_snapshot(snapshot)
+            if strategy == 'auto' and _planner.needs_commit_count(files):
+                commits = self._vcs.commit_count(
+                    commits=None if base is None else base.commits)
+        plan = _planner.choose(
+            files=files, commits=commits, strategy=strategy,
+            indexed=indexed, can_scan=can_scan)
+        _LOG.info('history plan for {} files: {} ({})'.format(
+            files, plan.strategy, plan.reason))
+        if plan.strategy == _planner.SCAN:
+            self._index_history(base=base)
+        if (plan.strategy == _planner.PER_FILE or
+                not self._vcs._history_authors):
+            self._vcs.prepare_queries(files=files)
+        return plan
+
+    def save_history(self, path):
+        """Write a snapshot of the indexed history to `path`.
+
+        Calls `index_history` first, if needed.  The snapshot can be
+        shared with other checkouts (including shallow clones) and
+        passed to their `index_history`.
+        """
+        if self._vcs._history is None:
+            self.index_history()
+        _LOG.info('save history snapshot {}'.format(path))
+        tmp = '{}.tmp'.format(path)
+        with open(tmp, 'wb') as f:
+            self._vcs._history.dump(f)
+        _os.replace(tmp, path)
+
+    def _set_contents(self, filename, contents, dry_run=False, patch=None):
+        """Like `utils.set_contents`, also writing a diff to `patch`."""
+        original = _utils.get_contents(
+            filename=filename, unicode=True, encoding=self._encoding)
+        if patch is not None:
+            path = _utils.relative_path(filename, self._root)
+            patch.write(_utils.unified_diff(path, original, contents))
+            patch.flush()
+        return _utils.set_contents(
+            filename=filename, contents=contents, original_contents=original,
+            unicode=True, encoding=self._encoding, dry_run=dry_run)
+
+    def update_authors(self, dry_run=False, patch=None):
+        """Update ``AUTHORS``.
+
+        If `patch` is given, it is a text stream to which a
+        `git apply`-compatible diff of the change is written.
+        """
         _LOG.info('update AUTHORS')
         authors = self._vcs.authors()
         new_contents = '{} was written by:\n{}\n'.format(
             self._name, '\n'.join(authors))
-        _utils.set_contents(
-            _os_path.join(self._root, 'AUTHORS'),
-            new_contents, unicode=True, encoding=self._encoding,
-            dry_run=dry_run)
+        return self._set_contents(
+            _os_path.join(self._root, 'AUTHORS'), new_contents,
+            dry_run=dry_run, patch=patch)
 
-    def update_file(self, filename, dry_run=False):
-        _LOG.info('update {}'.format(filename))
+    def _blurb_spans(self, contents):
+        """Return sorted ``(start, end, prefix)`` for each blurb."""
+        spans = []
+        for prefix in _PREFIXES:
+            for start,end in _utils.copyright_spans(
+                    contents=contents, prefix=prefix):
+                spans.append((start, end, prefix))
+        return sorted(spans)
+
+    def _read_blurbs(self, filename):
+        """Return the decoded contents of `filename` and its blurb spans.
+
+        Files larger than `_large_file_size` only have their leading
+        `_head_size` bytes read, unless the head ends inside a blurb,
+        or has no blurb while the rest of the file might.
+
+        >>> import os, tempfile
+        >>> p = Project(root=tempfile.mkdtemp())
+        >>> p._large_file_size = 100
+        >>> p._head_size = 64
+        >>> path = os.path.join(p._root, 'a.py')
+        >>> def read(*parts):
+        ...     with open(path, 'w') as f:
+        ...         _ = f.write(''.join(parts))
+        ...     contents,spans = p._read_blurbs(path)
+        ...     return (len(contents), [span[:2] for span in spans])
+        >>> read('# Copyright (C) 2000 A\\n', '\\n', 'x = 1\\n' * 30)
+        (60, [(0, 23)])
+        >>> read('x\\n' * 15, '# Copyright (C) 2000 A\\n', '# line\\n' * 5,
+        ...      'y\\n' * 30)
+        (148, [(30, 88)])
+        >>> read('x\\n' * 40, '# Copyright (C) 2000 A\\n', 'y\\n' * 20)
+        (143, [(80, 103)])
+        >>> read('x\\n' * 100)
+        (64, [])
+        """
+        if (_os_path.isfile(filename) and
+                _os_path.getsize(filename) > self._large_file_size):
+            encoding = self._encoding or _utils.ENCODING
+            head = _utils.get_head(filename, size=self._head_size)
+            contents = head.decode(encoding)
+            spans = self._blurb_spans(contents=contents)
+            if spans:
+                if max(end for start,end,prefix in spans) < len(contents):
+                    return (contents, spans)
+            elif not self._tag_after(filename, len(head), encoding):
+                return (contents, spans)
+            _LOG.debug('reading all of {}'.format(filename))
         contents = _utils.get_contents(
             filename=filename, unicode=True, encoding=self._encoding)
-        years = self._vcs.years(filename=filename)
-        authors = self._vcs.authors(filename=filename)
-        new_contents = _utils.update_copyright(
-            contents=contents, years=years, authors=authors,
-            text=self._copyright, info=self._info(), prefix=('# ', '# ', None),
-            width=self._width, tag=self._copyright_tag)
-        new_contents = _utils.update_copyright(
-            contents=new_contents, years=years,
-            authors=authors, text=self._copyright, info=self._info(),
-            prefix=('/* ', ' * ', ' */'), width=self._width,
-            tag=self._copyright_tag)
-        _utils.set_contents(
-            filename=filename, contents=new_contents,
-            original_contents=contents, unicode=True, encoding=self._encoding,
-            dry_run=dry_run)
+        if contents is None:
+            return (contents, [])
+        return (contents, self._blurb_spans(contents=contents))
+
+    def _tag_after(self, filename, offset, encoding):
+        """Return ``True`` if a blurb may start past `offset` bytes.
+
+        The raw bytes are searched for the encoded ``Copyright`` tag,
+        which only works for ASCII-compatible encodings.  For any
+        other encoding, assume there may be a blurb.
+        """
+        tag = 'Copyright'.encode(encoding)
+        if tag != b'Copyright':
+            return True
+        return _utils.find_bytes(filename, tag, start=offset) >= 0
+
+    def plan_file(self, filename):
+        """Return an `Edit` updating the blurbs in `filename`.
+
+        Returns ``None`` if `filename` is already up to date.  Nothing
+        is written to disk.
+        """
+        _LOG.info('plan {}'.format(filename))
+        contents,spans = self._read_blurbs(filename=filename)
+        if not spans:
+            _LOG.debug('no blurb in {}'.format(filename))
+            return None
+        return self._render_edit(
+            filename=filename, contents=contents, spans=spans,
+            years=self._vcs.years(filename=filename),
+            authors=self._vcs.authors(filename=filename))
+
+    def _blurb_body(self, prefix):
+        """Return the part of each `prefix` blurb after its first line.
+
+        It only depends on the configuration, so it is rendered once
+        and compared with the body from `utils.parse_copyright`.
+        """
+        info = self._info()
+        key = (prefix, tuple(self._copyright), self._width,
+               tuple(sorted(info.items())))
+        body = self._bodies.get(key)
+        if body is None:
+            string = _utils.copyright_string(
+                years=[0], authors=[''], text=self._copyright,
+                info=info, prefix=prefix, width=self._width)
+            body = self._bodies[key] = string.partition('\n')[2]
+        return body
 
-    def update_files(self, files=None, dry_run=False):
+    def _outdated(self, blurb, prefix, years, authors):
+        """List what is outdated in `blurb` (empty if it is up to date)."""
+        parsed = _utils.parse_copyright(blurb, prefix=prefix)
+        if parsed is None:
+            return ['layout']
+        _years,_authors,body = parsed
+        outdated = []
+        if _years != (min(years), max(years)):
+            outdated.append('years')
+        if _authors != list(authors):
+            outdated.append('authors')
+        if body != self._blurb_body(prefix=prefix):
+            outdated.append('license text')
+        return outdated
+
+    def _render_edit(self, filename, contents, spans, years, authors):
+        """Return an `Edit` replacing the blurbs at `spans`, or ``None``.
+
+        Blurbs whose parsed years, authors, and license text already
+        match are left alone without rendering them.  The edit's
+        reason lists what was outdated.
+        """
+        start = spans[0][0]
+        end = max(_end for _start,_end,prefix in spans)
+        strings = {}
+        replacements = []
+        reasons = []
+        for _start,_end,prefix in spans:
+            blurb = contents[_start:_end]
+            if years and authors:
+                outdated = self._outdated(
+                    blurb=blurb, prefix=prefix, years=years, authors=authors)
+                if not outdated:
+                    continue
+                reasons.extend(
+                    reason for reason in outdated if reason not in reasons)
+            if prefix not in strings:
+                strings[prefix] = _utils.copyright_string(
+                    years=years, authors=authors, text=self._copyright,
+                    info=self._info(), prefix=prefix, width=self._width)
+            string = strings[prefix]
+            if blurb.endswith('\r\n'):
+                string = string.replace('\n', '\r\n') + '\r\n'
+            elif blurb.endswith('\n'):
+                string += '\n'
+            replacements.append(((_start - start, _end - start), string))
+        original = contents[start:end]
+        header = _utils.splice(original, replacements)
+        if header == original:
+            _LOG.debug('no change in {}'.format(filename))
+            return None
+        reason = 'outdated copyright blurb'
+        if reasons:
+            reason = '{} ({})'.format(reason, ', '.join(reasons))
+        return _Edit(
+            path=filename, span=(start, end), original=original,
+            header=header, reason=reason)
+
+    def _candidate_files(self, files=None, shard=None):
         if files is None or len(files) == 0:
             files = _utils.list_files(root=self._root)
-        for filename in files:
-            if self._ignored_file(filename=filename):
+        files = list(files)
+        if shard is not None:
+            files = _shard.select(files, shard=shard, root=self._root)
+        return files
+
+    def _checked_files(self, files, progress, shard=None, history=None,
+                       snapshot=None, journal=None, record=None, vcs=True):
+        """Generate the files `plan_files` and `update_files` check.
+
+        Files `journal` lists as done and ignored files (see
+        `_ignore_reason`, which gets `vcs`) are passed to
+        `progress.file_skip` instead, and ignored files also to
+        `record` (if given), with the reason as the result.  If
+        `history` is given, `plan_history` is called with it as the
+        strategy once the files are listed.
+        """
+        files = self._candidate_files(files=files, shard=shard)
+        if journal is not None:
+            files = [filename for filename in files
+                     if _os_path.abspath(filename) != _os_path.abspath(
+                         journal.path)]
+        progress.start(total=len(files))
+        if history is not None:
+            progress.history_plan(self.plan_history(
+                files=len(files), strategy=history, snapshot=snapshot))
+        self._get_classifier().prefetch(
+            [_os_path.relpath(filename, self._root) for filename in files])
+        # check files in batches, so backends can prefetch per-file
+        # history (e.g. blame) in parallel without losing laziness
+        for i in range(0, len(files), self._batch_size):
+            batch = []
+            for filename in files[i:i+self._batch_size]:
+                if journal is not None and journal.done(filename):
+                    progress.file_skip(filename, reason='journaled')
+                    continue
+                reason = self._ignore_reason(filename=filename, vcs=vcs)
+                if reason is None:
+                    batch.append(filename)
+                    continue
+                progress.file_skip(filename, reason=reason)
+                if record is not None:
+                    record(filename, result=reason)
+            self._vcs.prefetch(batch)
+            for filename in batch:
+                yield filename
+
+    def plan_files(self, files=None, progress=None, shard=None):
+        """Generate an `Edit` for each file that needs updating.
+
+        With `files` ``None`` or empty, consider every file in the
+        project.  Edits are generated lazily, as each file is
+        checked.  If `progress` is given, it is a
+        `progress.Progress` instance whose hooks are called for each
+        file.  If `shard` is an ``(i, n)`` tuple, only consider the
+        files owned by that shard (see `shard.select`).
+        """
+        if progress is None:
+            progress = _Progress()
+        for filename in self._checked_files(
+                files=files, progress=progress, shard=shard):
+            progress.file_start(filename)
+            try:
+                edit = self.plan_file(filename=filename)
+            except UnicodeDecodeError as e:
+                _LOG.warning('skipping {} ({})'.format(filename, e))
+                progress.file_skip(filename, reason='undecodable')
                 continue
-            self.update_file(filename=filename, dry_run=dry_run)
+            progress.file_finish(filename, edit=edit is not None)
+            if edit is not None:
+                yield edit
+        self._vcs.flush()
+        progress.finish()
+
+    def apply_edit(self, edit, dry_run=False):
+        """Write `edit` (from `plan_file` or `plan_files`) to disk.
+
+        Raises `ValueError` if the file changed since the edit was
+        planned.  Large files (see `_read_blurbs`) only have their
+        head rewritten, unless the edit reaches past it.
+
+        >>> import os, tempfile
+        >>> p = Project(root=tempfile.mkdtemp())
+        >>> p._large_file_size = 100
+        >>> p._head_size = 64
+        >>> path = os.path.join(p._root, 'a.py')
+        >>> def apply(contents, span, header):
+        ...     with open(path, 'w') as f:
+        ...         _ = f.write(contents)
+        ...     start,end = span
+        ...     p.apply_edit(_Edit(
+        ...         path=path, span=span, original=contents[start:end],
+        ...         header=header, reason='test'))
+        ...     with open(path, 'r') as f:
+        ...         return f.read() == (
+        ...             contents[:start] + header + contents[end:])
+        >>> tail = 'x = 1\\n' * 30
+        >>> apply('# Copyright (C) 2000 A\\n' + tail, (0, 23),
+        ...       '# Copyright (C) 2000-2010 A\\n')
+        True
+        >>> apply('# Copyright (C) 2000 A\\n' + tail, (0, 23), '# (C) A\\n')
+        True
+        >>> apply('x\\n' * 15 + '# Copyright (C) 2000 A\\n' + '# line\\n' * 5 +
+        ...       tail, (30, 88), '# Copyright (C) 2010 B\\n')
+        True
+        """
+        filename = edit.path
+        start,end = edit.span
+        if _os_path.getsize(filename) > self._large_file_size:
+            encoding = self._encoding or _utils.ENCODING
+            head = _utils.get_head(filename, size=self._head_size)
+            contents = head.decode(encoding)
+            if end < len(contents):
+                contents = contents[:end]
+                new_contents = edit.apply_to(contents)
+                _LOG.info('updating {}'.format(filename))
+                _utils.set_prefix(
+                    filename=filename, prefix=new_contents.encode(encoding),
+                    length=len(contents.encode(encoding)), dry_run=dry_run)
+                return True
+        contents = _utils.get_contents(
+            filename=filename, unicode=True, encoding=self._encoding)
+        return _utils.set_contents(
+            filename=filename, contents=edit.apply_to(contents),
+            original_contents=contents, unicode=True, encoding=self._encoding,
+            dry_run=dry_run)
+
+    def diff_edit(self, edit, context=3):
+        """Return a `git apply`-compatible diff for `edit`.
+
+        Paths in the diff are relative to the project root.
+        """
+        filename = edit.path
+        start,end = edit.span
+        contents = None
+        if _os_path.getsize(filename) > self._large_file_size:
+            head = _utils.get_head(filename, size=self._head_size)
+            contents = head.decode(self._encoding or _utils.ENCODING)
+            window = _utils.line_window(contents, start, end, context=context)
+            if window[1] == len(contents):  # may need lines past the head
+                contents = None
+        if contents is None:
+            contents = _utils.get_contents(
+                filename=filename, unicode=True, encoding=self._encoding)
+            window = _utils.line_window(contents, start, end, context=context)
+        window_start,window_end = window
+        return _utils.unified_diff(
+            _utils.relative_path(filename, self._root),
+            contents[window_start:window_end],
+            edit.apply_to(contents[:window_end])[window_start:],
+            offset=contents.count('\n', 0, window_start), context=context)
+
+    def update_file(self, filename, dry_run=False):
+        """Update the blurbs in `filename`.
+
+        Returns ``True`` if the file was (or, with `dry_run`, would
+        have been) changed.
+        """
+        try:
+            edit = self.plan_file(filename=filename)
+        except UnicodeDecodeError as e:
+            _LOG.warning('skipping {} ({})'.format(filename, e))
+            return False
+        if edit is None:
+            return False
+        return self.apply_edit(edit=edit, dry_run=dry_run)
+
+    def update_files(self, files=None, dry_run=False, progress=None,
+                     shard=None, patch=None, workers=None, history='auto',
+                     snapshot=None, journal=None):
+        """Update the blurbs in `files` (see `plan_files`).
+
+        Before any file is checked, `plan_history` chooses between
+        per-file history queries and a full scan, according to
+        `history` and `snapshot`.  The plan is passed to the
+        `progress.history_plan` hook.
+
+        The files are listed as for `plan_files`, and flow through a
+        `pipeline.Pipeline` with the stages in `pipeline.STAGES`.
+        `workers` maps stage names to thread counts, overriding
+        `pipeline.WORKERS`.  Files ruled out by the configuration or
+        their type are dropped before the pipeline, while the
+        ``filter`` stage asks the VCS whether each remaining file is
+        versioned.  Files are read before their history is looked
+        up, so files without blurbs cost no history queries.  Each
+        file is written as soon as it is ready.
+
+        If `patch` is given, it is a text stream to which a
+        `git apply`-compatible diff of each change is written (and
+        flushed).  Diffs are written in the order the files were
+        listed, so a slow file holds back the diffs (but not the
+        writes) of the files after it, up to `pipeline.WINDOW` files.
+
+        If `journal` is a `journal.Journal`, each finished file is
+        recorded in it (unless `dry_run`, since nothing was written),
+        and files it lists as done are skipped.
+        Returns the list of changed files, in the order they were
+        listed.
+        """
+        if progress is None:
+            progress = _Progress()
+        counts = dict(_pipeline.WORKERS)
+        counts.update(workers or {})
+
+        def finish(filename, result):
+            if journal is not None and not dry_run:
+                journal.record(filename, result=result)
+
+        def check(filename):
+            reason = self._vcs_ignore_reason(filename=filename)
+            if reason is not None:
+                progress.file_skip(filename, reason=reason)
+                finish(filename, result=reason)
+                return None
+            progress.file_start(filename)
+            return filename
+
+        def read(filename):
+            _LOG.info('plan {}'.format(filename))
+            try:
+                contents,spans = self._read_blurbs(filename=filename)
+            except UnicodeDecodeError as e:
+                _LOG.warning('skipping {} ({})'.format(filename, e))
+                progress.file_skip(filename, reason='undecodable')
+                finish(filename, result='undecodable')
+                return None
+            if not spans:
+                _LOG.debug('no blurb in {}'.format(filename))
+                progress.file_finish(filename, edit=False)
+                finish(filename, result='unchanged')
+                return None
+            return (filename, contents, spans)
+
+        def lookup_history(item):
+            filename,contents,spans = item
+            return (filename, contents, spans,
+                    self._vcs.years(filename=filename),
+                    self._vcs.authors(filename=filename))
+
+        def render(item):
+            filename,contents,spans,years,authors = item
+            edit = self._render_edit(
+                filename=filename, contents=contents, spans=spans,
+                years=years, authors=authors)
+            progress.file_finish(filename, edit=edit is not None)
+            if edit is None:
+                finish(filename, result='unchanged')
+            return edit
 
-    def update_pyfile(self, dry_run=False):
+        def write(edit):
+            diff = None
+            if patch is not None:
+                diff = self.diff_edit(edit=edit)
+            if not self.apply_edit(edit=edit, dry_run=dry_run):
+                finish(edit.path, result='unchanged')
+                return None
+            progress.file_change(edit.path)
+            finish(edit.path, result='changed')
+            return (edit.path, diff)
+
+        functions = {
+            'filter': check,
+            'read': read,
+            'history': lookup_history,
+            'render': render,
+            'write': write,
+            }
+        pipeline = _pipeline.Pipeline([
+                _pipeline.Stage(name, functions[name], workers=counts[name])
+                for name in _pipeline.STAGES], window=_pipeline.WINDOW)
+        changed = []
+        for filename,diff in pipeline.run(self._checked_files(
+                files=files, progress=progress, shard=shard,
+                history=history, snapshot=snapshot, journal=journal,
+                record=finish, vcs=False)):
+            if patch is not None:
+                patch.write(diff)
+                patch.flush()
+            changed.append(filename)
+        for stage in pipeline.stages:
+            _LOG.info(repr(stage))
+        stats = self._vcs.stats()
+        if stats:
+            _LOG.info('{} stats: {}'.format(
+                self._vcs.name, _json.dumps(stats, sort_keys=True)))
+        self._vcs.flush()
+        progress.finish()
+        return changed
+
+    def update_pyfile(self, dry_run=False, patch=None):
         if self._pyfile is None:
             _LOG.info('no pyfile location configured, skip `update_pyfile`')
-            return
+            return False
         _LOG.info('update pyfile at {}'.format(self._pyfile))
         current_year = _time.gmtime()[0]
         years = self._vcs.years()
@@ -241,9 +848,17 @@ class Project (object):
                 '',  # for terminal endline
                 ])
         new_contents = '\n'.join(lines)
-        _utils.set_contents(
-            filename=self._pyfile, contents=new_contents, unicode=True,
-            encoding=self._encoding, dry_run=dry_run)
+        return self._set_contents(
+            filename=self._pyfile, contents=new_contents, dry_run=dry_run,
+            patch=patch)
+
+    def _get_classifier(self):
+        if self._classifier is None:
+            with self._lock:
+                if self._classifier is None:
+                    self._classifier = _FileClassifier(
+                        root=self._root, vcs=self._vcs)
+        return self._classifier
 
     def _ignored_file(self, filename):
         """
@@ -262,17 +877,53 @@ class Project (object):
         >>> p._ignored_file('./z')
         False
         """
-        filename = _os_path.relpath(filename, self._root)
+        return self._ignore_reason(filename=filename) is not None
+
+    def _ignore_reason(self, filename, vcs=True):
+        """Return why `filename` should be skipped, or ``None``.
+
+        With `vcs` false, the files the VCS does not know are not
+        ruled out (see `_vcs_ignore_reason`), so no VCS queries are
+        made.
+
+        >>> p = Project()
+        >>> p._ignored_paths = ['a']
+        >>> p._ignore_reason('a/z')
+        'matched a'
+        >>> p._ignore_reason('z') is None
+        True
+        >>> p._ignore_reason('z.png')
+        'binary'
+        """
+        path = _os_path.relpath(filename, self._root)
+        reason = None
         if self._ignored_paths is not None:
-            base = filename
-            while base not in ['', '.', '..']:
-                for path in self._ignored_paths:
-                    if _fnmatch.fnmatch(base, _os_path.normpath(path)):
-                        _LOG.debug('ignoring {} (matched {})'.format(
-                                filename, path))
-                        return True
+            base = path
+            while base not in ['', '.', '..'] and reason is None:
+                for pattern in self._ignored_paths:
+                    if _fnmatch.fnmatch(base, _os_path.normpath(pattern)):
+                        reason = 'matched {}'.format(pattern)
+                        break
                 base = _os_path.split(base)[0]
+        if reason is None:
+            kind = self._get_classifier().classify(path)
+            if kind == 'binary' or (
+                    kind == 'generated' and self._skip_generated):
+                reason = kind
+        if reason is not None:
+            _LOG.debug('ignoring {} ({})'.format(path, reason))
+        elif vcs:
+            reason = self._vcs_ignore_reason(filename=filename)
+        return reason
+
+    def _vcs_ignore_reason(self, filename):
+        """Return ``'not versioned'`` if the VCS does not know `filename`.
+
+        Otherwise return ``None``.  Without an indexed history, this
+        costs a VCS query.
+        """
         if self._vcs and not self._vcs.is_versioned(filename):
-            _LOG.debug('ignoring {} (not versioned))'.format(filename))
-            return True
-        return False
+            _LOG.debug('ignoring {} (not versioned)'.format(
+                _os_path.relpath(filename, self._root)))
+            return 'not versioned'
+        return None
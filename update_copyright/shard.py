@@ -0,0 +1,226 @@
+# Copyright (C) 2014 W. Trevor King <wking@tremily.us>
+#
+# This file is part of update-copyright.
+#
+# update-copyright is free software: you can redistribute it and/or modify it
+# under the terms of the GNU General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# update-copyright is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# update-copyright.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Split a project's files across independent processes or machines.
+
+Shard ``i/n`` (counting from one) owns the files whose root-relative
+path hashes to ``i - 1`` modulo ``n``.  The hash (CRC-32 of the
+UTF-8 encoded, ``/``-separated path) does not depend on the
+platform, Python version, or file listing order, so every node
+agrees on the split without coordinating.
+
+Each shard records what it did in a `Report`, and `merge` combines
+the reports of all ``n`` shards into one.
+"""
+
+import json as _json
+import threading as _threading
+import time as _time
+import zlib as _zlib
+
+from .progress import Progress as _Progress
+from .utils import relative_path as _relative_path
+
+
+VERSION = 1
+
+
+def parse(string):
+    """Parse an ``i/n`` shard specification.
+
+    >>> parse('2/3')
+    (2, 3)
+    >>> parse('4/3')
+    Traceback (most recent call last):
+      ...
+    ValueError: invalid shard '4/3' (expected i/n with 1 <= i <= n)
+    """
+    try:
+        index,count = [int(x) for x in string.split('/')]
+    except ValueError:
+        index = count = 0
+    if not 1 <= index <= count:
+        raise ValueError(
+            'invalid shard {!r} (expected i/n with 1 <= i <= n)'.format(
+                string))
+    return (index, count)
+
+def owner(path, count):
+    """Return the shard (counting from one) owning the relative `path`.
+
+    >>> owner('a/b.py', 1)
+    1
+    >>> [owner(path, 3) for path in ['a.py', 'b.py', 'c.py', 'd.py']]
+    [2, 2, 1, 3]
+    """
+    return _zlib.crc32(path.encode('utf-8')) % count + 1
+
+def select(filenames, shard, root='.'):
+    """Return the files from `filenames` owned by `shard`.
+
+    >>> select(['/r/a.py', '/r/b.py', '/r/c.py'], shard=(2, 3), root='/r')
+    ['/r/a.py', '/r/b.py']
+    """
+    index,count = shard
+    return [filename for filename in filenames
+            if owner(_relative_path(filename, root), count) == index]
+
+
+class Report (_Progress):
+    """Summarize a (possibly sharded) run.
+
+    `Report` is a `progress.Progress`, so pass it to
+    `Project.update_files` to count the files.  Add the project-wide
+    changes (``AUTHORS``, pyfile) and the patch text yourself.
+
+    >>> import io
+    >>> report = Report(shard=(1, 2), root='/r', clock=lambda: 10.0)
+    >>> report.start(total=2)
+    >>> report.file_skip('/r/a.png', reason='binary')
+    >>> report.file_change('/r/b.py')
+    >>> report.patch = 'diff --git a/b.py b/b.py\\n'
+    >>> report.finish()
+    >>> stream = io.StringIO()
+    >>> report.dump(stream)
+    >>> Report.load(io.StringIO(stream.getvalue())).as_dict() == (
+    ...     report.as_dict())
+    True
+    >>> report
+    <Report 1/2: 1 of 2 files changed, 1 skipped>
+    """
+    def __init__(self, shard=None, root='.', clock=_time.time):
+        self.shard = shard
+        self.total = 0
+        self.skipped = 0
+        self.changed = []
+        self.patch = ''
+        self.elapsed = 0
+        self.history = None
+        self._root = root
+        self._clock = clock
+        self._start = None
+        self._lock = _threading.Lock()
+
+    def __repr__(self):
+        shard = ''
+        if self.shard is not None:
+            shard = ' {}/{}'.format(*self.shard)
+        return '<{}{}: {} of {} files changed, {} skipped>'.format(
+            type(self).__name__, shard, len(self.changed), self.total,
+            self.skipped)
+
+    def start(self, total):
+        self._start = self._clock()
+        self.total += total
+
+    def history_plan(self, plan):
+        self.history = plan.strategy
+
+    def file_skip(self, path, reason):
+        with self._lock:
+            self.skipped += 1
+
+    def file_change(self, path):
+        path = _relative_path(path, self._root)
+        with self._lock:
+            self.changed.append(path)
+
+    def finish(self):
+        if self._start is not None:
+            self.elapsed += self._clock() - self._start
+
+    def as_dict(self):
+        return {
+            'version': VERSION,
+            'shard': None if self.shard is None else list(self.shard),
+            'total': self.total,
+            'skipped': self.skipped,
+            'changed': list(self.changed),
+            'elapsed': self.elapsed,
+            'history': self.history,
+            'patch': self.patch,
+            }
+
+    def dump(self, stream):
+        _json.dump(self.as_dict(), stream, indent=2, sort_keys=True)
+        stream.write('\n')
+
+    @classmethod
+    def load(cls, stream):
+        data = _json.load(stream)
+        if data.get('version') != VERSION:
+            raise ValueError('unsupported report version {!r}'.format(
+                data.get('version')))
+        report = cls(shard=data['shard'] and tuple(data['shard']))
+        report.total = data['total']
+        report.skipped = data['skipped']
+        report.changed = data['changed']
+        report.elapsed = data['elapsed']
+        report.history = data.get('history')
+        report.patch = data['patch']
+        return report
+
+
+def merge(reports):
+    """Combine the reports from every shard of a run.
+
+    Raises `ValueError` unless `reports` covers each shard of the same
+    ``i/n`` split exactly once.  The patches are concatenated in shard
+    order, and the merged `Report` has no shard.  Its `elapsed` is
+    that of the slowest shard.
+
+    >>> reports = [Report(shard=(2, 2)), Report(shard=(1, 2))]
+    >>> reports[0].changed = ['b.py']
+    >>> reports[0].patch = 'b\\n'
+    >>> reports[1].changed = ['AUTHORS', 'a.py']
+    >>> reports[1].patch = 'a\\n'
+    >>> merged = merge(reports)
+    >>> merged.changed
+    ['AUTHORS', 'a.py', 'b.py']
+    >>> merged.patch
+    'a\\nb\\n'
+    >>> merge(reports[:1])
+    Traceback (most recent call last):
+      ...
+    ValueError: missing shard 1/2
+    """
+    shards = {}
+    counts = set()
+    for report in reports:
+        if report.shard is None:
+            raise ValueError('cannot merge an unsharded report')
+        index,count = report.shard
+        counts.add(count)
+        if index in shards:
+            raise ValueError('duplicate shard {}/{}'.format(index, count))
+        shards[index] = report
+    if len(counts) != 1:
+        raise ValueError('reports from different splits: {}'.format(
+            ', '.join(str(count) for count in sorted(counts))))
+    count = counts.pop()
+    for index in range(1, count + 1):
+        if index not in shards:
+            raise ValueError('missing shard {}/{}'.format(index, count))
+    merged = Report()
+    for index in range(1, count + 1):
+        report = shards[index]
+        merged.total += report.total
+        merged.skipped += report.skipped
+        merged.changed.extend(report.changed)
+        merged.patch += report.patch
+        merged.elapsed = max(merged.elapsed, report.elapsed)
+    return merged
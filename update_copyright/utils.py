@@ -16,14 +16,22 @@
 # update-copyright.  If not, see <http://www.gnu.org/licenses/>.
 
 import codecs as _codecs
-import difflib as _difflib
+import errno as _errno
 import locale as _locale
+import logging as _logging
 import os as _os
 import os.path as _os_path
+import re as _re
 import sys as _sys
-import textwrap as _textwrap
 
 from . import LOG as _LOG
+from .lazy import lazy_import as _lazy_import
+
+_difflib = _lazy_import('difflib')
+_mmap = _lazy_import('mmap')
+_shutil = _lazy_import('shutil')
+_tempfile = _lazy_import('tempfile')
+_textwrap = _lazy_import('textwrap')
 
 
 ENCODING = _locale.getpreferredencoding() or _sys.getdefaultencoding()
@@ -105,7 +113,22 @@ def copyright_string(years, authors, text, info={},
     Copyright (C) 2005 A <a@a.com>, B <b@b.edu>
     <BLANKLINE>
     This file is part of update-copyright.  This file is part of update-copyright.  This file is part of update-copyright.
+
+    The arguments are not modified, so shared configuration may be
+    rendered from several threads at once.
+
+    >>> text = ['{program} {{braces}}']
+    >>> for i in range(2):
+    ...     print(copyright_string(years=[2005], authors=['A'], text=text,
+    ...                            info={'program': 'P'}))
+    Copyright (C) 2005 A
+    <BLANKLINE>
+    P {braces}
+    Copyright (C) 2005 A
+    <BLANKLINE>
+    P {braces}
     """
+    wrap_kwargs = dict(wrap_kwargs)
     for key in ['initial_indent', 'subsequent_indent']:
         if key not in wrap_kwargs:
             wrap_kwargs[key] = prefix[1]
@@ -128,9 +151,10 @@ def copyright_string(years, authors, text, info={},
         else:
             lines[i] = prefix[1] + line
 
-    for i,paragraph in enumerate(text):
+    paragraphs = []
+    for paragraph in text:
         try:
-            text[i] = paragraph.format(**info)
+            paragraphs.append(paragraph.format(**info))
         except ValueError as e:
             _LOG.error(
                 "{}: can't format {} with {}".format(e, paragraph, info))
@@ -142,12 +166,12 @@ def copyright_string(years, authors, text, info={},
             raise
 
     if wrap == True:
-        text = [_textwrap.fill(p, **wrap_kwargs) for p in text]
+        paragraphs = [_textwrap.fill(p, **wrap_kwargs) for p in paragraphs]
     else:
         assert wrap_kwargs['subsequent_indent'] == '', \
             wrap_kwargs['subsequent_indent']
     sep = '\n{}\n'.format(prefix[1].rstrip())
-    ret = sep.join(['\n'.join(lines)] + text)
+    ret = sep.join(['\n'.join(lines)] + paragraphs)
     if prefix[2]:
         ret += ('\n{}'.format(prefix[2]))
     return ret
@@ -235,6 +259,226 @@ def update_copyright(contents, prefix=('# ', '# ', None), tag=None, **kwargs):
     contents = tag_copyright(contents=contents, prefix=prefix, tag=tag)
     return contents.replace(tag, string)
 
+def copyright_spans(contents, prefix=('# ', '# ', None)):
+    """Return ``(start, end)`` offsets of the copyright blurbs in `contents`.
+
+    Blurbs are detected the same way as in `tag_copyright`.  Each
+    span covers whole lines, including the final line's terminator.
+
+    >>> contents = '''Some file
+    ... # Copyright (copyright begins)
+    ... # (copyright continues)
+    ... (copyright ends)
+    ... '''
+    >>> spans = copyright_spans(contents)
+    >>> spans
+    [(10, 65)]
+    >>> print(contents[spans[0][0]:spans[0][1]], end='')
+    # Copyright (copyright begins)
+    # (copyright continues)
+    >>> contents = '''/* Copyright (copyright begins)
+    ...  *
+    ...  */
+    ... (copyright ends)
+    ... '''
+    >>> copyright_spans(contents, prefix=('/* ', ' * ', ' */'))
+    [(0, 39)]
+    """
+    spans = []
+    start = None
+    begin = prefix[0] + 'Copyright'
+    middle = prefix[1].rstrip()
+    end = prefix[2]
+    offset = 0
+    for line in contents.splitlines(True):
+        if start is None and line.startswith(begin):
+            start = offset
+        elif start is not None and not line.startswith(middle):
+            if end:
+                assert line.startswith(end), line
+            spans.append((start, offset))
+            start = None
+        offset += len(line)
+        if start is not None and end and line.startswith(end):
+            spans.append((start, offset))
+            start = None
+    if start is not None:
+        spans.append((start, offset))
+    return spans
+
+_COPYRIGHT_REGEXP = _re.compile(r'Copyright \(C\) ([0-9]+)(?:-([0-9]+))? (.*)')
+
+def parse_copyright(blurb, prefix=('# ', '# ', None)):
+    """Return ``(years, authors, body)`` for a blurb from `copyright_spans`.
+
+    `years` is the ``(first, last)`` year pair, `authors` the author
+    list, and `body` the text after the first line (with ``\\n`` line
+    endings), which does not depend on the years or authors.  Returns
+    ``None`` unless the blurb is laid out exactly as
+    `copyright_string` (with `long_author_formatter`) would lay it
+    out, so a blurb whose parsed values match the expected ones needs
+    no rewrite.
+
+    >>> blurb = '''# Copyright (C) 2005-2009 A <a@a.com>
+    ... #                         B <b@b.edu>
+    ... #
+    ... # BLURB
+    ... '''
+    >>> parse_copyright(blurb)
+    ((2005, 2009), ['A <a@a.com>', 'B <b@b.edu>'], '#\\n# BLURB')
+    >>> parse_copyright(blurb.replace('\\n', '\\r\\n'))[0]
+    (2005, 2009)
+    >>> parse_copyright('/* Copyright (C) 2005 A\\n *\\n * BLURB\\n */\\n',
+    ...                 prefix=('/* ', ' * ', ' */'))
+    ((2005, 2005), ['A'], ' *\\n * BLURB\\n */')
+    >>> print(parse_copyright('# Copyright (C) 2009-2005 A\\n'))
+    None
+    """
+    if blurb.endswith('\r\n'):
+        blurb = blurb[:-2]
+        if '\n' in blurb.replace('\r\n', ''):
+            return None  # mixed line endings
+        blurb = blurb.replace('\r\n', '\n')
+    elif blurb.endswith('\n'):
+        blurb = blurb[:-1]
+    if '\r' in blurb or not blurb.startswith(prefix[0]):
+        return None
+    first,_,body = blurb.partition('\n')
+    match = _COPYRIGHT_REGEXP.match(first, len(prefix[0]))
+    if match is None:
+        return None
+    first_year,last_year,author = match.groups()
+    years = (int(first_year), int(last_year or first_year))
+    if (str(years[0]) != first_year or
+            (last_year is not None and
+             (str(years[1]) != last_year or years[1] <= years[0]))):
+        return None
+    authors = [author]
+    indent = prefix[1] + ' ' * (match.start(3) - len(prefix[0]))
+    lines = body.split('\n') if body else []
+    while lines and lines[0].startswith(indent):
+        authors.append(lines.pop(0)[len(indent):])
+    return (years, authors, '\n'.join(lines))
+
+def splice(contents, replacements):
+    """Replace non-overlapping ``(start, end)`` spans in `contents`.
+
+    `replacements` is an iterable of ``((start, end), text)`` pairs.
+
+    >>> splice('abcdef', [((4, 5), 'YZ'), ((1, 3), 'X')])
+    'aXdYZf'
+    """
+    chunks = []
+    offset = 0
+    for (start,end),text in sorted(replacements):
+        chunks.extend([contents[offset:start], text])
+        offset = end
+    chunks.append(contents[offset:])
+    return ''.join(chunks)
+
+def unified_diff(path, old, new, offset=0, context=3):
+    """Return a `git apply`-compatible diff of `path` from `old` to `new`.
+
+    `old` and `new` may be a window into the file, in which case
+    `offset` is the number of lines preceding the window.  The window
+    should include `context` lines around the changes.  `old` is
+    ``None`` for files that do not exist yet.
+
+    >>> print(unified_diff('a/b.py', 'x\\nold\\ny\\n', 'x\\nnew\\ny\\n',
+    ...                    offset=10), end='')
+    diff --git a/a/b.py b/a/b.py
+    --- a/a/b.py
+    +++ b/a/b.py
+    @@ -11,3 +11,3 @@
+     x
+    -old
+    +new
+     y
+    >>> print(unified_diff('c', 'x', 'y'), end='')
+    diff --git a/c b/c
+    --- a/c
+    +++ b/c
+    @@ -1 +1 @@
+    -x
+    \\ No newline at end of file
+    +y
+    \\ No newline at end of file
+    >>> print(unified_diff('AUTHORS', None, 'Jack\\n'), end='')
+    diff --git a/AUTHORS b/AUTHORS
+    new file mode 100644
+    --- /dev/null
+    +++ b/AUTHORS
+    @@ -0,0 +1 @@
+    +Jack
+    """
+    if old == new:
+        return ''
+    lines = ['diff --git a/{0} b/{0}\n'.format(path)]
+    fromfile = 'a/{}'.format(path)
+    if old is None:
+        lines.append('new file mode 100644\n')
+        old = ''
+        fromfile = '/dev/null'
+    for line in _difflib.unified_diff(
+            old.splitlines(True), new.splitlines(True),
+            fromfile=fromfile, tofile='b/{}'.format(path), n=context):
+        if line.startswith('@@') and offset:
+            line = _re.sub(
+                r'^@@ -(\d+)(,\d+)? \+(\d+)(,\d+)? @@',
+                lambda m: '@@ -{}{} +{}{} @@'.format(
+                    int(m.group(1)) + offset, m.group(2) or '',
+                    int(m.group(3)) + offset, m.group(4) or ''),
+                line)
+        if not line.endswith('\n'):
+            line += '\n\\ No newline at end of file\n'
+        lines.append(line)
+    return ''.join(lines)
+
+def line_window(contents, start, end, context=3):
+    """Widen ``contents[start:end]`` by `context` whole lines each way.
+
+    `start` should be the start of a line.  Returns the widened
+    ``(start, end)``.
+
+    >>> line_window('a\\nb\\nc\\nd\\ne\\n', 4, 6, context=1)
+    (2, 8)
+    >>> line_window('a\\nb\\nc', 2, 4, context=3)
+    (0, 5)
+    """
+    for i in range(context):
+        if start == 0:
+            break
+        start = contents.rfind('\n', 0, start - 1) + 1
+    for i in range(context):
+        newline = contents.find('\n', end)
+        if newline < 0:
+            end = len(contents)
+            break
+        end = newline + 1
+    return (start, end)
+
+class Tee (object):
+    """Write to several text streams at once.
+
+    >>> import io
+    >>> a,b = io.StringIO(), io.StringIO()
+    >>> tee = Tee([a, b])
+    >>> tee.write('x')
+    >>> tee.flush()
+    >>> (a.getvalue(), b.getvalue())
+    ('x', 'x')
+    """
+    def __init__(self, streams):
+        self.streams = list(streams)
+
+    def write(self, text):
+        for stream in self.streams:
+            stream.write(text)
+
+    def flush(self):
+        for stream in self.streams:
+            stream.flush()
+
 def get_contents(filename, unicode=False, encoding=None):
     if _os_path.isfile(filename):
         if unicode:
@@ -250,32 +494,210 @@ def get_contents(filename, unicode=False, encoding=None):
 
 def set_contents(filename, contents, original_contents=None, unicode=False,
                  encoding=None, dry_run=False):
+    """Write `contents` to `filename` if they differ from what is there.
+
+    Returns ``True`` if the file was (or, with `dry_run`, would have
+    been) changed.
+    """
     if original_contents is None:
         original_contents = get_contents(
             filename=filename, unicode=unicode, encoding=encoding)
     _LOG.debug('check contents of {}'.format(filename))
-    if contents != original_contents:
-        if original_contents is None:
-            _LOG.info('creating {}'.format(filename))
-        else:
-            _LOG.info('updating {}'.format(filename))
+    if contents == original_contents:
+        _LOG.debug('no change in {}'.format(filename))
+        return False
+    if original_contents is None:
+        _LOG.info('creating {}'.format(filename))
+    else:
+        _LOG.info('updating {}'.format(filename))
+        if _LOG.isEnabledFor(_logging.DEBUG):  # diffing is expensive
             _LOG.debug('\n'.join(
                     _difflib.unified_diff(
                         original_contents.splitlines(), contents.splitlines(),
                         fromfile=_os_path.normpath(
                             _os_path.join('a', filename)),
-                        tofile=_os_path.normpath(_os_path.join('b', filename)),
+                        tofile=_os_path.normpath(
+                            _os_path.join('b', filename)),
                         n=3, lineterm='')))
-        if dry_run == False:
-            if unicode:
-                if encoding is None:
-                    encoding = ENCODING
-                f = _codecs.open(filename, 'w', encoding=encoding)
-            else:
-                f = file(filename, 'w')
-            f.write(contents)
-            f.close()
-    _LOG.debug('no change in {}'.format(filename))
+    if dry_run == False:
+        if unicode:
+            if encoding is None:
+                encoding = ENCODING
+            f = _codecs.open(filename, 'w', encoding=encoding)
+        else:
+            f = open(filename, 'w')
+        f.write(contents)
+        f.close()
+    return True
+
+def get_head(filename, size):
+    """Return up to the first `size` bytes of `filename`.
+
+    If the file is longer than `size`, the head is trimmed back to
+    the end of its last complete line.
+    """
+    with open(filename, 'rb') as f:
+        head = f.read(size)
+        if len(head) == size and f.read(1):
+            head = head[:head.rfind(b'\n') + 1]
+    return head
+
+def find_bytes(filename, needle, start=0):
+    """Return the offset of `needle` in `filename`, or -1.
+
+    The search starts at byte `start` and runs over a memory map, so
+    the file is never decoded or copied into Python.
+
+    >>> import os
+    >>> import tempfile
+    >>> fd,path = tempfile.mkstemp()
+    >>> os.write(fd, b'abc\\nCopyright\\n')
+    14
+    >>> os.close(fd)
+    >>> find_bytes(path, b'Copyright')
+    4
+    >>> find_bytes(path, b'Copyright', start=5)
+    -1
+    >>> os.remove(path)
+    """
+    with open(filename, 'rb') as f:
+        if _os.fstat(f.fileno()).st_size <= start:
+            return -1
+        m = _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+        try:
+            return m.find(needle, start)
+        finally:
+            m.close()
+
+def _copy_range(source, target, offset, count):
+    """Copy `count` bytes from `offset` in `source` to `target`.
+
+    Both arguments are file descriptors, and the data is copied at
+    the current position of `target`.  Use the kernel's in-place copy
+    when possible, so the data never passes through Python.
+
+    Without ``copy_file_range`` and ``sendfile`` (or if they fail,
+    e.g. across file systems), fall back to a plain copy.
+
+    >>> import errno
+    >>> import os
+    >>> import tempfile
+    >>> from unittest import mock
+    >>> def copy(**attributes):
+    ...     with tempfile.TemporaryFile() as s, tempfile.TemporaryFile() as t:
+    ...         _ = s.write(b'0123456789')
+    ...         _ = t.write(b'ab')
+    ...         s.flush()
+    ...         t.flush()
+    ...         with mock.patch.dict(os.__dict__, attributes):
+    ...             _copy_range(s.fileno(), t.fileno(), offset=4, count=6)
+    ...         t.seek(0)
+    ...         return t.read()
+    >>> copy()
+    b'ab456789'
+    >>> copy(copy_file_range=None, sendfile=None)
+    b'ab456789'
+    >>> error = OSError(errno.EXDEV, 'cross-device link')
+    >>> copy(copy_file_range=mock.Mock(side_effect=error), sendfile=None)
+    b'ab456789'
+    """
+    for name in ['copy_file_range', 'sendfile']:
+        fn = getattr(_os, name, None)
+        if fn is None:
+            continue
+        try:
+            while count > 0:
+                if name == 'copy_file_range':
+                    copied = fn(source, target, count, offset)
+                else:
+                    copied = fn(target, source, offset, count)
+                if copied == 0:
+                    break
+                offset += copied
+                count -= copied
+        except OSError as e:
+            if e.errno not in [_errno.EINVAL, _errno.ENOSYS, _errno.EXDEV,
+                               _errno.EOPNOTSUPP, _errno.EBADF]:
+                raise
+            continue
+        if count == 0:
+            return
+    with _os.fdopen(_os.dup(source), 'rb') as s:
+        with _os.fdopen(_os.dup(target), 'ab') as t:
+            s.seek(offset)
+            _shutil.copyfileobj(s, t)
+
+def set_prefix(filename, prefix, length, dry_run=False):
+    """Replace the first `length` bytes of `filename` with `prefix`.
+
+    The rest of the file is never decoded.  When `prefix` is exactly
+    `length` bytes long, the file is patched in place through
+    `mmap`.  Otherwise the tail is copied into a new file, which then
+    replaces the original (keeping its permissions).
+
+    >>> import os
+    >>> import tempfile
+    >>> fd,path = tempfile.mkstemp()
+    >>> os.write(fd, b'# old\\ntail\\n')
+    11
+    >>> os.close(fd)
+    >>> os.chmod(path, 0o640)
+    >>> def contents():
+    ...     with open(path, 'rb') as f:
+    ...         return f.read()
+    >>> set_prefix(path, b'# new\\n', length=6)
+    >>> contents()
+    b'# new\\ntail\\n'
+    >>> set_prefix(path, b'# longer\\n', length=6)
+    >>> contents()
+    b'# longer\\ntail\\n'
+    >>> set_prefix(path, b'#\\n', length=9)
+    >>> contents()
+    b'#\\ntail\\n'
+    >>> oct(os.stat(path).st_mode & 0o777)
+    '0o640'
+    >>> set_prefix(path, b'# dry\\n', length=2, dry_run=True)
+    >>> contents()
+    b'#\\ntail\\n'
+    >>> os.remove(path)
+    """
+    _LOG.debug('replace {}-byte prefix of {}'.format(length, filename))
+    if dry_run:
+        return
+    if len(prefix) == length:
+        if length == 0:
+            return
+        with open(filename, 'r+b') as f:
+            m = _mmap.mmap(f.fileno(), 0)
+            try:
+                m[:length] = prefix
+                m.flush()
+            finally:
+                m.close()
+        return
+    dirname,basename = _os_path.split(_os_path.abspath(filename))
+    fd,path = _tempfile.mkstemp(prefix='.{}.'.format(basename), dir=dirname)
+    try:
+        with _os.fdopen(fd, 'wb') as target:
+            target.write(prefix)
+            target.flush()
+            with open(filename, 'rb') as source:
+                size = _os.fstat(source.fileno()).st_size
+                _copy_range(source.fileno(), target.fileno(),
+                            offset=length, count=size - length)
+        _shutil.copymode(filename, path)
+        _os.replace(path, filename)
+    except BaseException:
+        _os.remove(path)
+        raise
+
+def relative_path(filename, root='.'):
+    """Return the ``/``-separated path of `filename` relative to `root`.
+
+    >>> relative_path('/a/b/c.py', root='/a')
+    'b/c.py'
+    """
+    return _os_path.relpath(filename, root).replace(_os.sep, '/')
 
 def list_files(root='.'):
     for dirpath,dirnames,filenames in _os.walk(root):
@@ -20,54 +20,162 @@
 import os.path as _os_path
 
 from . import utils as _utils
+from .. import hacks as _hacks
 
 
 class VCSBackend (object):
     name = None
+    # whether `authors` for a single file may come from `_history`
+    _history_authors = True
+    # whether `index_history` is supported
+    can_index_history = False
 
     def __init__(self, root='.', author_hacks=None, year_hacks=None,
                  aliases=None):
         self._root = root
-        if author_hacks is None:
-            author_hacks = {}
+        self._history = None
+        self.configure(
+            author_hacks=author_hacks, year_hacks=year_hacks, aliases=aliases)
+
+    def configure(self, author_hacks=None, year_hacks=None, aliases=None):
+        """Set the hacks and aliases applied to every lookup.
+
+        `author_hacks` and `year_hacks` are `hacks.PathTrie` instances
+        (or dicts mapping paths to author sets or years), and `aliases`
+        maps canonical names to aliases.  Dicts are copied, and a
+        `hacks.PathTrie` must not be changed once passed in.  Call
+        this before any lookups; lookups from several threads are safe
+        afterwards.
+        """
+        if not isinstance(author_hacks, _hacks.PathTrie):
+            author_hacks = _hacks.PathTrie(author_hacks)
+        if not isinstance(year_hacks, _hacks.PathTrie):
+            year_hacks = _hacks.PathTrie(dict(
+                    (path, [year])
+                    for path,year in (year_hacks or {}).items()))
         self._author_hacks = author_hacks
-        if year_hacks is None:
-            year_hacks = {}
         self._year_hacks = year_hacks
-        if aliases is None:
-            aliases = {}
-        self._aliases = aliases
+        self._aliases = dict(
+            (author, frozenset(_aliases))
+            for author,_aliases in (aliases or {}).items())
+
+    def _index_history(self, base=None):
+        raise NotImplementedError('history index for {}'.format(self.name))
+
+    def index_history(self, base=None):
+        """Scan the whole history once into a `HistoryStore`.
+
+        Later `years`, `authors`, and `is_versioned` calls are
+        answered from the store instead of per-file VCS queries.  If
+        `base` is a `HistoryStore` (e.g. loaded from a snapshot),
+        only the commits since ``base.commits`` are scanned, where
+        the backend supports it.  Raises `NotImplementedError` unless
+        `can_index_history`.
+        """
+        self._history = self._index_history(base=base)
+        return self._history
+
+    def revision(self):
+        """Return a string identifying the current state of the history.
+
+        It changes whenever a commit is added or the checked-out
+        revision changes.
+        """
+        raise NotImplementedError()
+
+    def commit_count(self, commits=None):
+        """Return the number of commits `index_history` would scan.
+
+        `commits` is the ``commits`` of a base `HistoryStore`, as
+        passed to `index_history`.
+        """
+        raise NotImplementedError()
+
+    def _path_parts(self, filename):
+        """Return the components of `filename` relative to the root."""
+        return _utils.splitpath(_os_path.relpath(filename, self._root))
+
+    def _history_path(self, filename):
+        return '/'.join(self._path_parts(filename))
 
     def _years(self, filename=None):
         raise NotImplementedError()
 
     def years(self, filename=None):
-        years = self._years(filename=filename)
         if filename is None:
-            years.update(self._year_hacks.values())
+            if self._history is None:
+                years = self._years()
+            else:
+                years = self._history.years()
+            years.update(self._year_hacks.all())
+            return sorted(years)
+        parts = self._path_parts(filename)
+        if self._history is None:
+            years = self._years(filename=filename)
         else:
-            filename = _os_path.relpath(filename, self._root)
-            splitpath = _utils.splitpath(filename)
-            if splitpath in self._year_hacks:
-                years.add(self._year_hacks[splitpath])
-        years = sorted(years)
-        return years
+            years = self._history.years(path='/'.join(parts))
+        years.update(self._year_hacks.match(parts))
+        return sorted(years)
 
     def _authors(self, filename=None):
         raise NotImplementedError()
 
     def authors(self, filename=None, with_emails=True):
-        authors = self._authors(filename=filename)
         if filename is None:
-            for path,_authors in self._author_hacks.items():
-                authors.update(_authors)
+            if self._history is None:
+                authors = self._authors()
+            else:
+                authors = self._history.authors()
+            authors.update(self._author_hacks.all())
         else:
-            filename = _os_path.relpath(filename, self._root)
-            splitpath = _utils.splitpath(filename)
-            if splitpath in self._author_hacks:
-                authors.update(self._author_hacks[splitpath])
+            parts = self._path_parts(filename)
+            if self._history is None or not self._history_authors:
+                authors = self._authors(filename=filename)
+            else:
+                authors = self._history.authors(path='/'.join(parts))
+            authors.update(self._author_hacks.match(parts))
         return _utils.replace_aliases(
             authors, with_email=with_emails, aliases=self._aliases)
 
-    def is_versioned(self, filename=None):
+    def prefetch(self, filenames):
+        """Warm any per-file caches for a batch of `filenames`.
+
+        Backends that can answer batches more efficiently than one
+        file at a time (e.g. in parallel) override this.
+        """
+        pass
+
+    def prepare_queries(self, files):
+        """Get ready to look up the history of `files` files one by one.
+
+        Called before per-file `years`, `authors`, and `is_versioned`
+        queries (i.e. when the history is not indexed).  Backends that
+        can speed those queries up (e.g. by refreshing an on-disk
+        index) override this.
+        """
+        pass
+
+    def stats(self):
+        """Return a JSON-serializable dict of backend statistics."""
+        return {}
+
+    def flush(self):
+        """Persist any on-disk caches."""
+        pass
+
+    def attributes(self, filenames, names):
+        """Return VCS attributes for each of `filenames`.
+
+        The result maps each filename to a dict of attribute values
+        (``'set'``, ``'unset'``, or a string value).  Backends
+        without per-path attributes return an empty dict.
+        """
+        return {}
+
+    def _is_versioned(self, filename):
         raise NotImplementedError()
+
+    def is_versioned(self, filename):
+        if self._history is not None:
+            return self._history_path(filename) in self._history
+        return self._is_versioned(filename=filename)
@@ -15,56 +15,831 @@
 # You should have received a copy of the GNU General Public License along with
 # update-copyright.  If not, see <http://www.gnu.org/licenses/>.
 
+import concurrent.futures as _futures
+import hashlib as _hashlib
+import json as _json
+import os as _os
+import os.path as _os_path
+import struct as _struct
+import threading as _threading
+import time as _time
+
 from . import VCSBackend as _VCSBackend
 from . import utils as _utils
+from ..lazy import lazy_import as _lazy_import
+from ..utils import ENCODING as _ENCODING
+
+_history = _lazy_import('..history', package=__package__)
+
+
+# `git --version`, probed on first use and shared by all backends
+_VERSION = None
+_VERSION_LOCK = _threading.Lock()
+
+# Git reads commit-graphs by default (core.commitGraph) since 2.24
+COMMIT_GRAPH_VERSION = (2, 24)
+
+
+class CommitGraphFile (object):
+    """The parts of a Git commit-graph file we need, read from `stream`.
+
+    `chunks` maps chunk IDs to their offsets, and `commits` is the
+    number of commits in the file.
+
+    >>> import io, struct
+    >>> table = struct.pack(
+    ...     '>4sQ4sQ4sQ', b'OIDF', 44, b'OIDL', 1068, b'\\0' * 4, 1088)
+    >>> fanout = struct.pack('>256I', *([0] * 0xab + [1] * (256 - 0xab)))
+    >>> graph = CommitGraphFile(io.BytesIO(
+    ...     b'CGPH\\x01\\x01\\x02\\x00' + table + fanout + b'\\xab' * 20))
+    >>> graph.commits
+    1
+    >>> graph.contains('ab' * 20), graph.contains('cd' * 20)
+    (True, False)
+    """
+    _header = _struct.Struct('>4sBBBB')
+    _chunk = _struct.Struct('>4sQ')
+    _hash_sizes = {1: 20, 2: 32}  # SHA-1, SHA-256
+
+    def __init__(self, stream):
+        self._stream = stream
+        magic,version,hash_version,chunks,bases = self._header.unpack(
+            stream.read(self._header.size))
+        if magic != b'CGPH' or hash_version not in self._hash_sizes:
+            raise ValueError('not a commit-graph file')
+        self._hash_size = self._hash_sizes[hash_version]
+        self.chunks = {}
+        for i in range(chunks):
+            chunk,offset = self._chunk.unpack(stream.read(self._chunk.size))
+            self.chunks[chunk] = offset
+        self.commits = self._fanout(255)
+
+    def _fanout(self, byte):
+        """Return the number of commits whose first byte is <= `byte`."""
+        if byte < 0:
+            return 0
+        self._stream.seek(self.chunks[b'OIDF'] + 4 * byte)
+        return _struct.unpack('>I', self._stream.read(4))[0]
+
+    def contains(self, commit):
+        """Return true if `commit` (a hex ID) is in this file."""
+        oid = bytes.fromhex(commit)
+        low = self._fanout(oid[0] - 1)
+        high = self._fanout(oid[0])
+        while low < high:  # binary search of the sorted OID lookup
+            middle = (low + high) // 2
+            self._stream.seek(self.chunks[b'OIDL'] + middle * self._hash_size)
+            found = self._stream.read(self._hash_size)
+            if found == oid:
+                return True
+            elif found < oid:
+                low = middle + 1
+            else:
+                high = middle
+        return False
+
+
+class BlameCache (object):
+    """Authors of the surviving lines in each blob.
+
+    Blobs are immutable, so an entry stays valid until the `key`
+    (derived from the ignored revisions) changes.  The cache is
+    stored as JSON at `path`.
+    """
+    version = 1
+
+    def __init__(self, path=None, key=''):
+        self._path = path
+        self._key = key
+        self._blobs = {}
+        self._dirty = False
+        self._lock = _threading.Lock()
+        if path is not None and _os_path.isfile(path):
+            try:
+                with open(path, 'r') as f:
+                    data = _json.load(f)
+            except ValueError as e:
+                _utils.LOG.warning(
+                    'ignoring corrupt blame cache {} ({})'.format(path, e))
+            else:
+                if (data.get('version') == self.version and
+                        data.get('key') == key):
+                    self._blobs = data['blobs']
+
+    def get(self, blob):
+        return self._blobs.get(blob)
+
+    def set(self, blob, authors):
+        with self._lock:
+            self._blobs[blob] = sorted(authors)
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if self._path is None or not self._dirty:
+                return
+            dirname = _os_path.dirname(self._path)
+            if not _os_path.isdir(dirname):
+                _os.makedirs(dirname)
+            tmp = '{}.tmp'.format(self._path)
+            with open(tmp, 'w') as f:
+                _json.dump({'version': self.version, 'key': self._key,
+                            'blobs': self._blobs}, f)
+            _os.replace(tmp, self._path)
+            self._dirty = False
 
 
 class GitBackend (_VCSBackend):
     name = 'Git'
+    can_index_history = True
 
-    def __init__(self, **kwargs):
-        super(GitBackend, self).__init__(**kwargs)
-        self._version = self._git_cmd('--version').split(' ')[-1]
+    @property
+    def _version(self):
+        global _VERSION
+        if _VERSION is None:
+            with _VERSION_LOCK:
+                if _VERSION is None:
+                    _VERSION = self._git_cmd('--version').split(' ')[-1]
+        return _VERSION
+
+    @property
+    def _author_format(self):
         if self._version.startswith('1.5.'):
             # Author name <author email>
-            self._author_format = '--pretty=format:%an <%ae>'
-            self._year_format = ['--pretty=format:%ai']  # Author date
+            return '--pretty=format:%an <%ae>'
+        return '--pretty=format:%aN <%aE>'
+
+    @property
+    def _year_format(self):
+        if self._version.startswith('1.5.'):
             # YYYY-MM-DD HH:MM:SS Z
             # Earlier versions of Git don't seem to recognize --date=short
-        else:
-            self._author_format = '--pretty=format:%aN <%aE>'
-            self._year_format = ['--pretty=format:%ad',  # Author date
-                                 '--date=short']         # YYYY-MM-DD
+            return ['--pretty=format:%ai']  # Author date
+        return ['--pretty=format:%ad',  # Author date
+                '--date=short']         # YYYY-MM-DD
+
+    @property
+    def _version_info(self):
+        info = []
+        for part in self._version.split('.'):
+            if not part.isdigit():
+                break
+            info.append(int(part))
+        return tuple(info)
+
+    def __init__(self, blame=False, ignore_revs_file=None,
+                 write_commit_graph=False, **kwargs):
+        super(GitBackend, self).__init__(**kwargs)
+        self._repositories = None
+        self._blame = blame
+        self._history_authors = not blame
+        self._ignore_revs_file = ignore_revs_file
+        self._write_commit_graph = write_commit_graph
+        self._blobs = None
+        self._blame_cache = None
+        self._stats = {'path_queries': 0, 'path_query_seconds': 0}
+        self._stats_lock = _threading.Lock()
+        # guards the lazily discovered repositories, blobs, and cache
+        self._lock = _threading.Lock()
 
-    def _git_cmd(self, *args):
+    def _git_cmd(self, *args, **kwargs):
         status,stdout,stderr = _utils.invoke(
-            ['git'] + list(args), cwd=self._root, unicode_output=True)
+            ['git'] + list(args), cwd=self._root, unicode_output=True,
+            **kwargs)
         return stdout.rstrip('\n')
 
+    def _count_query(self, start):
+        with self._stats_lock:
+            self._stats['path_queries'] += 1
+            self._stats['path_query_seconds'] += _time.time() - start
+
+    def _path_query(self, *args):
+        """Run a path-limited Git command, counting it in `stats`."""
+        start = _time.time()
+        try:
+            return self._git_cmd(*args)
+        finally:
+            self._count_query(start)
+
+    def _git_stream(self, *args):
+        """Yield the NUL-separated records output by a Git command."""
+        return _utils.invoke_stream(['git'] + list(args), cwd=self._root)
+
+    def _nested_paths(self):
+        """List checked-out submodules and linked worktrees under the root.
+
+        Paths are relative to the root.
+        """
+        paths = set()
+        output = self._git_cmd(
+            'config', '-z', '--file', '.gitmodules', '--get-regexp',
+            r'^submodule\..*\.path$', expect=(0, 1))
+        for record in output.split('\0'):
+            if record:
+                key,path = record.split('\n', 1)
+                paths.add(path)
+        try:
+            output = self._git_cmd('worktree', 'list', '--porcelain')
+        except ValueError:  # Git < 2.5
+            output = ''
+        for line in output.splitlines():
+            if line.startswith('worktree '):
+                path = _os_path.relpath(
+                    line[len('worktree '):], _os_path.realpath(self._root))
+                if path != '.' and not path.startswith(_os_path.pardir):
+                    paths.add(path)
+        return [path for path in sorted(paths)
+                if _os_path.exists(_os_path.join(self._root, path, '.git'))]
+
+    def _get_repositories(self):
+        """Return nested repositories, keyed by their split root path.
+
+        Discovered on first use, since most runs never leave the
+        superproject.
+        """
+        if self._repositories is None:
+            with self._lock:
+                if self._repositories is None:
+                    ignore_revs_file = None
+                    if self._ignore_revs_file:
+                        # Git reads the file relative to its working
+                        # directory, and the nested root is elsewhere
+                        ignore_revs_file = _os_path.join(
+                            self._root, self._ignore_revs_file)
+                    repositories = {}
+                    for path in self._nested_paths():
+                        repositories[_utils.splitpath(path)] = GitBackend(
+                            root=_os_path.join(self._root, path),
+                            blame=self._blame,
+                            ignore_revs_file=ignore_revs_file,
+                            write_commit_graph=self._write_commit_graph)
+                    self._repositories = repositories
+        return self._repositories
+
+    def _all_repositories(self, prefix=''):
+        """Yield ``(prefix, backend)`` for this and all nested repositories.
+        """
+        yield (prefix, self)
+        for path,backend in sorted(self._get_repositories().items()):
+            for item in backend._all_repositories(
+                    prefix='{}{}/'.format(prefix, '/'.join(path))):
+                yield item
+
+    def _route(self, filename):
+        """Return the repository owning `filename` and its path there.
+
+        The returned path is relative to the returned backend's root.
+        Files in submodules get the submodule's history, whether it is
+        looked up per file or scanned.
+
+        >>> import os, tempfile
+        >>> from update_copyright.benchmark import scripted_repository
+        >>> root = tempfile.mkdtemp()
+        >>> sub = scripted_repository(os.path.join(root, 'sub'), [
+        ...     (2001, 'X <x@x.com>', [('M', 'x.py', 'x')]),
+        ...     (2003, 'Y <y@y.com>', [('M', 'x.py', 'y')]),
+        ...     ])
+        >>> gitmodules = '[submodule "sub"]\\n\\tpath = sub\\n'
+        >>> _ = scripted_repository(root, [
+        ...     (2010, 'S <s@s.com>', [
+        ...         ('M', '.gitmodules', gitmodules), ('G', 'sub', sub),
+        ...         ('M', 'a.py', 'a')]),
+        ...     (2012, 'T <t@t.com>', [('M', 'a.py', 'b')]),
+        ...     ])
+        >>> per_file = GitBackend(root=root)
+        >>> backend,path = per_file._route(os.path.join(root, 'sub', 'x.py'))
+        >>> backend._root == os.path.join(root, 'sub'), path
+        (True, 'x.py')
+        >>> def history(backend, path):
+        ...     path = os.path.join(root, path)
+        ...     years = backend.years(filename=path)
+        ...     authors = sorted(a[0] for a in backend.authors(path))
+        ...     return (min(years), max(years), ''.join(authors))
+        >>> scan = GitBackend(root=root)
+        >>> _ = scan.index_history()
+        >>> for path in ['a.py', os.path.join('sub', 'x.py')]:
+        ...     print(path, history(per_file, path), history(scan, path))
+        a.py (2010, 2012, 'ST') (2010, 2012, 'ST')
+        sub/x.py (2001, 2003, 'XY') (2001, 2003, 'XY')
+        """
+        parts = _utils.splitpath(_os_path.relpath(filename, self._root))
+        backend = self
+        while True:
+            repositories = backend._get_repositories()
+            for i in range(len(parts) - 1, 0, -1):
+                if parts[:i] in repositories:
+                    backend = repositories[parts[:i]]
+                    parts = parts[i:]
+                    break
+            else:
+                return (backend, _os_path.join(*parts))
+
     def _dates(self, filename=None):
         args = ['log'] + self._year_format
-        if filename is not None:
-            args.extend(['--follow'] + [filename])
-        output = self._git_cmd(*args)
+        if filename is None:
+            # the whole history can be huge, so stream it
+            dates = self._git_stream('log', '-z', *self._year_format)
+        else:
+            args.extend(['--follow', '--', filename])
+            dates = self._path_query(*args).splitlines()
         if self._version.startswith('1.5.'):
-            output = '\n'.join([x.split()[0] for x in output.splitlines()])
-        return output.splitlines()
+            dates = (date.split()[0] for date in dates)
+        return dates
 
-    def _years(self, filename=None):
+    def _repository_years(self, filename=None):
         dates = self._dates(filename=filename)
         years = set(int(date.split('-', 1)[0]) for date in dates)
         return years
 
-    def _authors(self, filename=None):
+    def _years(self, filename=None):
+        if filename is None:
+            years = set()
+            for prefix,backend in self._all_repositories():
+                years.update(backend._repository_years())
+            return years
+        backend,filename = self._route(filename)
+        return backend._repository_years(filename=filename)
+
+    def _repository_authors(self, filename=None):
         args = ['log', self._author_format]
-        if filename is not None:
-            args.extend(['--follow', filename])
-        output = self._git_cmd(*args)
+        if filename is None:
+            return set(self._git_stream('log', '-z', self._author_format))
+        args.extend(['--follow', '--', filename])
+        output = self._path_query(*args)
         authors = set(output.splitlines())
         return authors
 
-    def is_versioned(self, filename):
-        output = self._git_cmd('log', '--follow', filename)
+    def _authors(self, filename=None):
+        if filename is None:
+            authors = set()
+            for prefix,backend in self._all_repositories():
+                authors.update(backend._repository_authors())
+            return authors
+        backend,filename = self._route(filename)
+        if self._blame:
+            return backend._repository_blame_authors(filename=filename)
+        return backend._repository_authors(filename=filename)
+
+    def _get_blobs(self):
+        """Return a dict mapping each path in ``HEAD`` to its blob ID."""
+        if self._blobs is None:
+            with self._lock:
+                if self._blobs is None:
+                    self._blobs = self._list_blobs()
+        return self._blobs
+
+    def _list_blobs(self):
+        blobs = {}
+        try:
+            for record in self._git_stream('ls-tree', '-r', '-z', 'HEAD'):
+                info,path = record.split('\t', 1)
+                mode,type,blob = info.split(' ')
+                blobs[path] = blob
+        except ValueError:  # no commits yet
+            blobs = {}
+        return blobs
+
+    def _get_blame_cache(self):
+        if self._blame_cache is None:
+            with self._lock:
+                if self._blame_cache is None:
+                    self._blame_cache = self._load_blame_cache()
+        return self._blame_cache
+
+    def _load_blame_cache(self):
+        key = ''
+        if self._ignore_revs_file:
+            with open(_os_path.join(
+                    self._root, self._ignore_revs_file), 'rb') as f:
+                key = _hashlib.sha1(f.read()).hexdigest()
+        try:
+            git_dir = self._git_cmd('rev-parse', '--git-common-dir')
+        except ValueError:  # Git < 2.5
+            git_dir = self._git_cmd('rev-parse', '--git-dir')
+        path = _os_path.join(
+            self._root, git_dir, 'update-copyright', 'blame-cache.json')
+        return BlameCache(path=path, key=key)
+
+    def _blame_authors(self, filename):
+        """Return the authors of the lines of `filename` in ``HEAD``."""
+        args = ['blame', '--line-porcelain']
+        if self._ignore_revs_file:
+            args.extend(['--ignore-revs-file', self._ignore_revs_file])
+        args.extend(['HEAD', '--', filename])
+        # only decode the author lines, the file contents may be binary
+        start = _time.time()
+        status,stdout,stderr = _utils.invoke(['git'] + args, cwd=self._root)
+        self._count_query(start)
+        authors = set()
+        name = None
+        for line in stdout.splitlines():
+            if line.startswith(b'author '):
+                name = str(line[len('author '):], _ENCODING)
+            elif line.startswith(b'author-mail '):
+                authors.add('{} {}'.format(
+                    name, str(line[len('author-mail '):], _ENCODING)))
+        return authors
+
+    def _repository_blame_authors(self, filename):
+        """Return the authors who still own lines in `filename`.
+
+        Results are cached by blob ID, so unchanged files are only
+        blamed once.
+        """
+        blob = self._get_blobs().get('/'.join(_utils.splitpath(filename)))
+        if blob is None:  # not in HEAD
+            return self._repository_authors(filename=filename)
+        cache = self._get_blame_cache()
+        authors = cache.get(blob)
+        if authors is None:
+            authors = self._blame_authors(filename=filename)
+            cache.set(blob, authors)
+        return set(authors)
+
+    def prefetch(self, filenames):
+        if not self._blame:
+            return
+        pending = []
+        for filename in filenames:
+            backend,path = self._route(filename)
+            blob = backend._get_blobs().get('/'.join(_utils.splitpath(path)))
+            if blob is not None and backend._get_blame_cache().get(
+                    blob) is None:
+                pending.append((backend, path))
+        if not pending:
+            return
+        workers = min(len(pending), _os.cpu_count() or 1)
+        with _futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            for authors in pool.map(
+                    lambda item: item[0]._repository_blame_authors(item[1]),
+                    pending):
+                pass
+
+    def flush(self):
+        for prefix,backend in self._all_repositories():
+            if backend._blame_cache is not None:
+                backend._blame_cache.save()
+
+    def _commit_graph_files(self):
+        """Return the paths of this repository's commit-graph files.
+
+        That is the single ``commit-graph`` file if there is one, or
+        else the layers of a split commit-graph chain.
+        """
+        info = _os_path.join(self._root, self._git_cmd(
+                'rev-parse', '--git-path', 'objects/info'))
+        path = _os_path.join(info, 'commit-graph')
+        if _os_path.isfile(path):
+            return [path]
+        graphs = _os_path.join(info, 'commit-graphs')
+        path = _os_path.join(graphs, 'commit-graph-chain')
+        if not _os_path.isfile(path):
+            return []
+        with open(path, 'r') as f:
+            return [_os_path.join(graphs, 'graph-{}.graph'.format(layer))
+                    for layer in f.read().split()]
+
+    def _commit_graph_state(self):
+        """Describe how well the commit-graph serves per-file queries.
+
+        One of ``'missing'`` (no commit-graph), ``'stale'`` (``HEAD``
+        is not in the graph, so recent commits are walked slowly), or
+        ``'ready'``.
+        """
+        head = self._head()
+        graphs = []
+        try:
+            for path in self._commit_graph_files():
+                with open(path, 'rb') as f:
+                    graph = CommitGraphFile(f)
+                    graphs.append(graph)
+                    contains_head = head is not None and graph.contains(head)
+                    if contains_head:
+                        break
+        except (IOError, OSError, ValueError, KeyError) as e:
+            _utils.LOG.warning('{}: unreadable commit-graph ({})'.format(
+                    self._root, e))
+            return 'missing'
+        if not graphs:
+            return 'missing'
+        if head is not None and not contains_head:
+            return 'stale'
+        return 'ready'
+
+    def _probe_path(self):
+        """Return a path to time `_path_query` with, or ``None``.
+
+        The most recently changed path, whose ``--follow`` query walks
+        the whole history like most per-file queries do.
+        """
+        if self._head() is None:
+            return None
+        for path in self._git_cmd(
+                'log', '-1', '--format=', '--name-only').splitlines():
+            if path:
+                return path
+        return None
+
+    def _probe(self, path):
+        start = _time.time()
+        self._git_cmd('log', '--follow', '--format=%H', '--', path)
+        return _time.time() - start
+
+    def _refresh_commit_graph(self):
+        """Write a commit-graph if it is missing or stale.
+
+        Per-file queries use ``--follow``, for which Git does not
+        consult changed-path Bloom filters, so none are written: the
+        speedup comes from reading commits from the graph.
+        """
+        state = self._commit_graph_state()
+        self._stats['commit_graph'] = state
+        if state == 'ready':
+            return
+        if not self._write_commit_graph:
+            _utils.LOG.info(
+                '{}: commit-graph is {}; set commit-graph = yes in [project] '
+                'to speed up per-file history queries'.format(
+                    self._root, state))
+            return
+        if self._version_info < COMMIT_GRAPH_VERSION:
+            _utils.LOG.warning(
+                '{}: Git {} does not read commit-graphs by default'.format(
+                    self._root, self._version))
+            return
+        if self._shallow_boundary():
+            # Git does not use commit-graphs in shallow clones
+            _utils.LOG.info('{}: shallow clone, not writing a commit-graph'
+                            .format(self._root))
+            return
+        _utils.LOG.info('{}: writing commit-graph ({})'.format(
+                self._root, state))
+        path = self._probe_path()
+        if path is not None:
+            self._stats['probe_seconds_before'] = self._probe(path)
+        start = _time.time()
+        self._git_cmd('commit-graph', 'write', '--reachable')
+        self._stats['commit_graph_write_seconds'] = _time.time() - start
+        self._stats['commit_graph'] = self._commit_graph_state()
+        if path is not None:
+            before = self._stats['probe_seconds_before']
+            after = self._stats['probe_seconds_after'] = self._probe(path)
+            if after > 0:
+                self._stats['speedup'] = before / after
+
+    def prepare_queries(self, files):
+        if files == 0:
+            return
+        for prefix,backend in self._all_repositories():
+            backend._refresh_commit_graph()
+
+    def stats(self):
+        stats = {}
+        for prefix,backend in self._all_repositories():
+            with backend._stats_lock:
+                stats[prefix] = dict(backend._stats)
+        return stats
+
+    def attributes(self, filenames, names):
+        groups = {}
+        for filename in filenames:
+            backend,path = self._route(filename)
+            groups.setdefault(backend, []).append((filename, path))
+        attributes = {}
+        for backend,_filenames in groups.items():
+            paths = dict((path, filename) for filename,path in _filenames)
+            for path,values in backend._repository_attributes(
+                    paths, names=names).items():
+                attributes[paths.get(path, path)] = values
+        return attributes
+
+    def _repository_attributes(self, filenames, names):
+        filenames = list(filenames)
+        if not filenames:
+            return {}
+        status,stdout,stderr = _utils.invoke(
+            ['git', 'check-attr', '-z', '--stdin'] + list(names),
+            stdin=''.join(f + '\0' for f in filenames).encode(_ENCODING),
+            cwd=self._root, unicode_output=True)
+        fields = stdout.split('\0')
+        attributes = {}
+        for i in range(0, len(fields) - 2, 3):
+            filename,name,value = fields[i:i+3]
+            if value != 'unspecified':
+                attributes.setdefault(filename, {})[name] = value
+        return attributes
+
+    def _index_history(self, base=None):
+        repositories = list(self._all_repositories())
+        if base is not None:
+            histories = self._extend_histories(base, repositories)
+            if histories is not None:
+                new = _history.HistoryStore()
+                for (prefix,backend),nested in zip(repositories, histories):
+                    new.update(nested, prefix=prefix)
+                # files renamed since the snapshot inherit its history
+                history = _history.HistoryStore()
+                history.update(base, renames=new.renames)
+                history.update(new)
+                return history
+        histories = self._map_repositories(
+            lambda item: item[1]._scan_history(), repositories)
+        history = histories[0]
+        for (prefix,backend),nested in zip(repositories[1:], histories[1:]):
+            history.update(nested, prefix=prefix)
+        return history
+
+    def revision(self):
+        return ' '.join(
+            '{}={}'.format(prefix, backend._head())
+            for prefix,backend in self._all_repositories())
+
+    def commit_count(self, commits=None):
+        if commits is None:
+            commits = {}
+        count = 0
+        for prefix,backend in self._all_repositories():
+            if backend._head() is None:
+                continue
+            revisions = ['HEAD']
+            since = commits.get(prefix)
+            if since is not None and backend._is_ancestor(since):
+                revisions.append('^{}'.format(since))
+            count += int(backend._git_cmd('rev-list', '--count', *revisions))
+        return count
+
+    def _map_repositories(self, fn, repositories):
+        if len(repositories) == 1:
+            return [fn(repositories[0])]
+        workers = min(len(repositories), _os.cpu_count() or 1)
+        with _futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(fn, repositories))
+
+    def _extend_histories(self, base, repositories):
+        """Scan each repository's commits since those in `base`.
+
+        Returns ``None`` if `base` cannot be extended, in which case
+        the caller should scan the full history instead.
+        """
+        def extend(item):
+            prefix,backend = item
+            since = base.commits.get(prefix)
+            if since is None:
+                return None
+            if backend._is_ancestor(since):
+                return backend._scan_history(since=since)
+            boundary = backend._shallow_boundary()
+            if boundary:
+                # The full history is not available, so the snapshot
+                # is better than nothing.  Commits already in the
+                # snapshot are harmless duplicates, but boundary
+                # commits look like they add every file, so skip them.
+                _utils.LOG.warning(
+                    '{}: snapshot commit {} not in this shallow clone; '
+                    'commits between it and the shallow boundary may be '
+                    'missing'.format(backend._root, since))
+                return backend._scan_history(exclude=boundary)
+            _utils.LOG.warning(
+                '{}: snapshot commit {} is not an ancestor of HEAD; '
+                'rescanning the full history'.format(backend._root, since))
+            return None
+        histories = self._map_repositories(extend, repositories)
+        if any(history is None for history in histories):
+            return None
+        return histories
+
+    def _head(self):
+        """Return the commit ID of ``HEAD``, or ``None`` in an empty repo."""
+        return self._git_cmd(
+            'rev-parse', '--verify', '--quiet', 'HEAD', expect=(0, 1)) or None
+
+    def _is_ancestor(self, commit):
+        status,stdout,stderr = _utils.invoke(
+            ['git', 'merge-base', '--is-ancestor', commit, 'HEAD'],
+            cwd=self._root, expect=(0, 1, 128))
+        return status == 0
+
+    def _shallow_boundary(self):
+        """Return the boundary commits of a shallow clone (or ``[]``)."""
+        path = self._git_cmd('rev-parse', '--git-path', 'shallow')
+        path = _os_path.join(self._root, path)
+        if not _os_path.isfile(path):
+            return []
+        with open(path, 'r') as f:
+            return f.read().split()
+
+    def _scan_history(self, since=None, exclude=()):
+        """Scan this repository's history, ignoring nested repositories.
+
+        With `since`, only scan the commits after it.  Commits in
+        `exclude` (and their ancestors) are skipped.  Renames are
+        followed as per-file queries follow them, so both agree.
+
+        >>> import os, tempfile
+        >>> from update_copyright.benchmark import scripted_repository
+        >>> root = tempfile.mkdtemp()
+        >>> _ = scripted_repository(root, [
+        ...     (2001, 'A <a@a.com>', [('M', 'old.py', 'a')]),
+        ...     (2003, 'B <b@b.com>', [('M', 'old.py', 'b')]),
+        ...     (2005, 'C <c@c.com>', [('R', 'old.py', 'new.py')]),
+        ...     (2007, 'D <d@d.com>', [('M', 'new.py', 'd')]),
+        ...     (2009, 'E <e@e.com>', [('M', 'old.py', 'reused')]),
+        ...     ])
+        >>> def history(backend, path):
+        ...     path = os.path.join(root, path)
+        ...     years = backend.years(filename=path)
+        ...     authors = sorted(a[0] for a in backend.authors(path))
+        ...     return (min(years), max(years), ''.join(authors))
+        >>> per_file = GitBackend(root=root)
+        >>> scan = GitBackend(root=root)
+        >>> _ = scan.index_history()
+        >>> for path in ['new.py', 'old.py']:
+        ...     print(path, history(per_file, path),
+        ...           history(per_file, path) == history(scan, path))
+        new.py (2001, 2007, 'ABCD') True
+        old.py (2001, 2009, 'ABCE') True
+        """
+        history = _history.HistoryStore()
+        head = self._head()
+        if head is None:
+            return history
+        history.commits[''] = head
+        revisions = [head]
+        if since is not None:
+            revisions.append('^{}'.format(since))
+        revisions.extend('^{}'.format(commit) for commit in exclude)
+        # Each commit is a '\x01'-marked header line, followed by
+        # NUL-terminated status letters, each followed by the path it
+        # applies to (or, for renames, the old and new paths).  The
+        # first status shares a record with the header.
+        records = self._git_stream(
+            'log', '-z', '--name-status', '-M', '--date=short',
+            '--pretty=format:%x01%at %ad %aN <%aE>', *(revisions + ['--']))
+        # Like `git log --follow`, walk from the newest commit back,
+        # and once a path is renamed, credit the older commits
+        # touching its old path to the paths following the new one.
+        # `history.renames` maps old paths to their followers; all
+        # other paths follow themselves.
+        header = None
+        paths = []
+        moves = []
+        status = None
+        names = []
+        for record in records:
+            if record.startswith('\x01'):
+                if header is not None:
+                    self._add_commit(history, header, paths, moves)
+                record,_,status = record[1:].partition('\n')
+                timestamp,date,author = record.split(' ', 2)
+                header = {
+                    'timestamp': int(timestamp),
+                    'year': int(date.split('-', 1)[0]),
+                    'author': author,
+                    }
+                paths = []
+                moves = []
+                names = []
+                status = status or None
+            elif not record:
+                continue
+            elif status is None:
+                status = record
+            else:
+                names.append(record)
+                if status.startswith('R'):
+                    if len(names) < 2:
+                        continue
+                    moves.append(tuple(names))
+                paths.extend(names)
+                status = None
+                names = []
+        if header is not None:
+            self._add_commit(history, header, paths, moves)
+        return history
+
+    def _add_commit(self, history, header, paths, moves):
+        """Add a commit touching `paths` and renaming `moves` to `history`.
+
+        Rows go to the paths following each of `paths` (see
+        `_scan_history`).  Then each ``(old, new)`` path in `moves`
+        hands the older history of `old` to the followers of `new`.
+        """
+        renames = history.renames
+        followers = []
+        for path in paths:
+            followers.extend(renames.get(path, (path,)))
+        history.add_commit(paths=list(dict.fromkeys(followers)), **header)
+        for old,new in moves:
+            renames[old] = tuple(dict.fromkeys(
+                renames.get(old, (old,)) + renames.get(new, (new,))))
+            renames[new] = ()
+
+    def _is_versioned(self, filename):
+        backend,filename = self._route(filename)
+        # everything in HEAD has history, and one listing covers it all
+        if '/'.join(_utils.splitpath(filename)) in backend._get_blobs():
+            return True
+        output = backend._path_query('log', '--follow', '--', filename)
         if len(output) == 0:
             return False
         return True
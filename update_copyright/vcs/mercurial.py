@@ -21,37 +21,45 @@ from . import utils as _utils
 
 class MercurialBackend (_VCSBackend):
     name = 'Mercurial'
+    # per-file queries only; `--history auto` falls back to them
+    can_index_history = False
 
-    def __init__(self, **kwargs):
-        super(MercurialBackend, self).__init__(**kwargs)
-        self._version = _version
-
-    def _hg_cmd(*args):
+    def _hg_cmd(self, *args):
         status,stdout,stderr = _utils.invoke(
             ['hg'] + list(args), cwd=self._root, unicode_output=True)
         return stdout.rstrip('\n')
 
+    def _hg_stream(self, *args):
+        """Yield the NUL-separated records output by a Mercurial command."""
+        return _utils.invoke_stream(['hg'] + list(args), cwd=self._root)
+
+    def _log(self, template, filename=None):
+        """Yield `template` expanded for each changeset.
+
+        Whole-repository logs are streamed, since they can be huge.
+        """
+        if filename is None:
+            return self._hg_stream('log', '--template', template + '\0')
+        return self._hg_cmd(
+            'log', '--template', template + '\n', '--follow', filename
+            ).splitlines()
+
+    def revision(self):
+        return self._hg_cmd('log', '--rev', '.', '--template', '{node}')
+
     def _years(self, filename=None):
-        args = [
-            '--template', '{date|shortdate}\n',
-            # shortdate filter: YEAR-MONTH-DAY
-            ]
-        if filename is not None:
-            args.extend(['--follow', filename])
-        output,error = mercurial_cmd('log', *args)
-        years = set(int(line.split('-', 1)[0]) for line in output.splitlines())
+        # shortdate filter: YEAR-MONTH-DAY
+        dates = self._log('{date|shortdate}', filename=filename)
+        years = set(int(date.split('-', 1)[0]) for date in dates)
         return years
 
     def _authors(self, filename=None):
-        args = ['--template', '{author}\n']
-        if filename is not None:
-            args.extend(['--follow', filename])
-        output,error = mercurial_cmd('log', *args)
-        authors = set(output.splitlines())
+        authors = set(self._log('{author}', filename=filename))
         return authors
 
-    def is_versioned(self, filename):
-        output,error = mercurial_cmd('log', '--follow', filename)
-        if len(error) > 0:
+    def _is_versioned(self, filename):
+        try:
+            self._hg_cmd('log', '--follow', filename)
+        except ValueError:
             return False
         return True
@@ -17,14 +17,17 @@
 
 """Useful utilities for backend classes."""
 
-import email.utils as _email_utils
 import os.path as _os_path
 import subprocess as _subprocess
 import sys as _sys
 
 from .. import LOG as LOG
+from ..lazy import lazy_import as _lazy_import
 from ..utils import ENCODING as _ENCODING
 
+_email_utils = _lazy_import('email.utils')
+_tempfile = _lazy_import('tempfile')
+
 
 _MSWINDOWS = _sys.platform == 'win32'
 _POSIX = not _MSWINDOWS
@@ -66,6 +69,69 @@ def invoke(args, stdin=None, stdout=_subprocess.PIPE, stderr=_subprocess.PIPE,
         raise ValueError([args, status, stdout, stderr])
     return status, stdout, stderr
 
+def invoke_stream(args, cwd=None, separator=b'\0', expect=(0,),
+                  encoding=None, chunk_size=2**16):
+    """Invoke an external program and yield its output records.
+
+    Unlike `invoke`, stdout is never held in memory as a whole.  It
+    is read in chunks of `chunk_size` bytes and split on `separator`
+    (a single byte), and each record is decoded and yielded as soon
+    as it is complete.  Records spanning several chunks are only
+    joined once.  A trailing empty record is dropped.  After the
+    output is exhausted, raise `ValueError` if the exit status is not
+    in `expect`.  Closing the generator early kills the program.
+
+    >>> list(invoke_stream(['printf', r'a\\0bb\\0c'], chunk_size=2))
+    ['a', 'bb', 'c']
+    >>> list(invoke_stream(['printf', r'aaaaa\\0b'], chunk_size=2))
+    ['aaaaa', 'b']
+    >>> list(invoke_stream(['printf', r'a\\nb\\n'], separator=b'\\n'))
+    ['a', 'b']
+    """
+    if encoding is None:
+        encoding = _ENCODING
+    LOG.debug('{}$ {} (streaming)'.format(cwd, args))
+    stderr = _tempfile.TemporaryFile()
+    try:
+        try:
+            q = _subprocess.Popen(
+                args, stdin=_subprocess.DEVNULL, stdout=_subprocess.PIPE,
+                stderr=stderr, close_fds=_POSIX, shell=_MSWINDOWS, cwd=cwd)
+        except OSError as e:
+            raise ValueError([args, e])
+        finished = False
+        try:
+            pending = []  # chunks of the incomplete last record
+            while True:
+                chunk = q.stdout.read1(chunk_size)
+                if not chunk:
+                    break
+                if separator not in chunk:
+                    pending.append(chunk)
+                    continue
+                records = chunk.split(separator)
+                if pending:
+                    pending.append(records[0])
+                    records[0] = b''.join(pending)
+                pending = [records.pop()]
+                for record in records:
+                    yield str(record, encoding)
+            pending = b''.join(pending)
+            if pending:
+                yield str(pending, encoding)
+            finished = True
+        finally:
+            q.stdout.close()
+            if not finished and q.poll() is None:
+                q.kill()
+            status = q.wait()
+        if status not in expect:
+            stderr.seek(0)
+            raise ValueError(
+                [args, status, None, str(stderr.read(), encoding)])
+    finally:
+        stderr.close()
+
 def splitpath(path):
     """Recursively split a path into elements.
 